@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+
+import experiments
+
+"""
+Bankroll / risk of ruin simulations, for lots of paths.
+
+This is the `simulate_bankroll` / `actual_simulation` idea from the DONT GO BROKE episode,
+but the paths are simulated in fixed-size chunks, and only running statistics get kept
+(BankrollStats), so memory doesn't depend on how many paths you run.
+10^7 paths x 1000 games is fine on a laptop, it just takes a while.
+
+Bet sizing:
+    'flat'    -- bet `bet_size` every game (like actual_simulation)
+    'percent' -- bet `bet_size` * current bankroll (like simulate_bankroll)
+    'kelly'   -- bet `bet_size` * the Kelly fraction of the current bankroll,
+                 so bet_size=.5 is half Kelly.
+
+Ruin is absorbing: once the bankroll is at or below `ruin_level`, that path stops betting.
+A bet can never lose more than what's left, so flat bets get smaller near the bottom.
+"""
+
+class QuantileSketch:
+    """
+    Log-bucketed histogram for quantiles of positive values (the DDSketch idea). Any
+    quantile comes back within `accuracy` relative error, and it only stores one count
+    per bucket. Values <= 0 all go into one zero bucket.
+    """
+    def __init__(self, accuracy=.005):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.counts = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+
+        keys = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        (unique_keys, key_counts) = np.unique(keys, return_counts=True)
+        for (key, n) in zip(unique_keys.tolist(), key_counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def merge(self, other):
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for (key, n) in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen > rank:
+                return 2 * (self.gamma ** key) / (self.gamma + 1)
+        return 2 * (self.gamma ** max(self.counts)) / (self.gamma + 1)
+
+
+class BankrollStats:
+    """
+    Running totals for a bankroll simulation. Chunks (or whole simulations with the
+    same settings) can be combined with merge().
+    """
+    DRAWDOWN_BINS = np.linspace(0, 1, 51)
+
+    def __init__(self, games, init_bankroll):
+        self.games = games
+        self.init_bankroll = init_bankroll
+        self.paths = 0
+        self.ruined = 0
+        self.profitable = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.best = -np.inf
+        self.worst = np.inf
+        self.final_sketch = QuantileSketch()
+        # how many paths went broke on each game
+        self.ruin_games = np.zeros(games, dtype=np.int64)
+        # biggest drop from the high-water mark, as a fraction of the high-water mark
+        self.drawdowns = np.zeros(len(self.DRAWDOWN_BINS) - 1, dtype=np.int64)
+
+    def add(self, final, ruin_game, max_drawdown):
+        self.paths += len(final)
+        self.profitable += np.sum(final > self.init_bankroll)
+        self.total += final.sum()
+        self.total_squares += np.square(final).sum()
+        self.best = max(self.best, final.max())
+        self.worst = min(self.worst, final.min())
+        self.final_sketch.add(final)
+
+        went_broke = ruin_game >= 0
+        self.ruined += np.sum(went_broke)
+        self.ruin_games += np.bincount(ruin_game[went_broke], minlength=self.games)
+        self.drawdowns += np.histogram(max_drawdown, bins=self.DRAWDOWN_BINS)[0]
+
+    def merge(self, other):
+        self.paths += other.paths
+        self.ruined += other.ruined
+        self.profitable += other.profitable
+        self.total += other.total
+        self.total_squares += other.total_squares
+        self.best = max(self.best, other.best)
+        self.worst = min(self.worst, other.worst)
+        self.final_sketch.merge(other.final_sketch)
+        self.ruin_games += other.ruin_games
+        self.drawdowns += other.drawdowns
+        return self
+
+    def ruin_probability(self):
+        return self.ruined / self.paths
+
+    def ruin_curve(self):
+        # chance of having gone broke by each game
+        return pd.Series(np.cumsum(self.ruin_games) / self.paths, index=np.arange(1, self.games + 1))
+
+    def drawdown_histogram(self):
+        bins = self.DRAWDOWN_BINS
+        index = pd.IntervalIndex.from_arrays(bins[:-1], bins[1:], closed='left')
+        return pd.Series(self.drawdowns, index=index)
+
+    def mean(self):
+        return self.total / self.paths
+
+    def std(self):
+        return np.sqrt(max(0, (self.total_squares / self.paths) - (self.mean() ** 2)))
+
+    def quantiles(self, qs=(.01, .05, .25, .5, .75, .95, .99)):
+        return pd.Series([self.final_sketch.quantile(q) for q in qs], index=qs)
+
+    def report(self):
+        print(f"Simulating {self.paths:,} times, {self.games} games")
+        print(f"We went broke {100 * self.ruin_probability():.3f}% of the time")
+        print(f"made money {100 * self.profitable / self.paths:.2f}% of the time")
+        print(f"Best result {self.best:,.2f}, Worst {self.worst:,.2f}, \n"
+              f"mean {self.mean():,.2f}, std {self.std():,.2f}, median {self.final_sketch.quantile(.5):,.2f}")
+
+
+def kelly_fraction(skill=.56, vig=1.1):
+    # a bet of f wins f and loses vig * f. maximizing p*log(1 + f) + q*log(1 - vig*f)
+    # gives f* = (p - q*vig) / vig
+    return (skill - ((1 - skill) * vig)) / vig
+
+def simulate_chunk(paths, games, rng, init_bankroll=1000, skill=.56, vig=1.1,
+                   sizing='flat', bet_size=20, ruin_level=0):
+    """
+    Simulate one chunk of paths, game by game.
+    Returns (final bankroll, game they went broke on or -1, max drawdown fraction)
+    """
+    if sizing == 'kelly':
+        fraction = bet_size * kelly_fraction(skill, vig)
+        if fraction <= 0:
+            raise ValueError("no edge, kelly says don't bet")
+    elif sizing == 'percent':
+        fraction = bet_size
+    elif sizing != 'flat':
+        raise ValueError(f"unknown bet sizing {sizing}")
+
+    bankroll = np.full(paths, float(init_bankroll))
+    peak = bankroll.copy()
+    max_drawdown = np.zeros(paths)
+    ruin_game = np.full(paths, -1, dtype=np.int64)
+    alive = bankroll > ruin_level
+
+    for game in range(games):
+        if sizing == 'flat':
+            stake = np.full(paths, float(bet_size))
+        else:
+            stake = fraction * bankroll
+        # can't lose more than what's left
+        stake = np.minimum(stake, bankroll / vig)
+        stake[~alive] = 0
+
+        won = rng.random(paths) < skill
+        bankroll += np.where(won, stake, -vig * stake)
+        # (losing everything can leave -0.000001 from rounding)
+        np.maximum(bankroll, 0, out=bankroll)
+
+        went_broke = alive & (bankroll <= ruin_level)
+        ruin_game[went_broke] = game
+        alive &= ~went_broke
+
+        np.maximum(peak, bankroll, out=peak)
+        np.maximum(max_drawdown, (peak - bankroll) / peak, out=max_drawdown)
+
+    return (bankroll, ruin_game, max_drawdown)
+
+def chunk_size_for(memory_mb):
+    # about 10 float64 arrays of `paths` at once inside simulate_chunk
+    return max(1, int(memory_mb * 2**20) // 80)
+
+def _stats_block(paths, rng, games, init_bankroll, **settings):
+    # one chunk of paths for experiments.run_trials
+    stats = BankrollStats(games, init_bankroll)
+    stats.add(*simulate_chunk(paths, games, rng, init_bankroll=init_bankroll, **settings))
+    return stats
+
+def simulate_bankroll(sims=100000, games=1000, init_bankroll=1000, skill=.56, vig=1.1,
+                      sizing='flat', bet_size=20, ruin_level=0, memory_mb=64, seed=2718,
+                      workers=None, silent=False):
+    """
+    Streaming bankroll simulation. Runs `sims` paths, a chunk at a time so no more
+    than about `memory_mb` is ever in use (per worker), and returns the BankrollStats.
+
+    Every chunk gets its own random stream spawned from `seed`, so the result only
+    depends on the seed and the chunk size -- not on `workers`, the number of processes
+    the chunks are spread over.
+    """
+    stats = experiments.run_trials(_stats_block, sims, block_size=chunk_size_for(memory_mb),
+                                   seed=seed, workers=workers, games=games, 
+                                   init_bankroll=init_bankroll, skill=skill, vig=vig,
+                                   sizing=sizing, bet_size=bet_size, ruin_level=ruin_level)
+
+    if not silent:
+        stats.report()
+    return stats
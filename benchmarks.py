@@ -0,0 +1,275 @@
+import contextlib
+import datetime
+import glob
+import io
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import scrape_sbr
+import fader
+import html_archive
+import intro
+import synthetic
+from bet_grading import BetGrading
+
+"""
+Timing checks for the slow parts of the pipeline.
+
+run_suite() times the pipeline (clean_data, get_ats_for_range, superfade, ...) on
+synthetic seasons of different lengths, and the Monte Carlo experiments at different
+trial counts, all with fixed seeds. It records wall time and peak memory for each, and
+can save the results as json so two commits can be compared with compare_runs():
+
+    python benchmarks.py suite --out before.json
+    (change things)
+    python benchmarks.py suite --out after.json
+    python benchmarks.py compare before.json after.json
+"""
+
+def _default_pages(dir='sbr', days=30):
+    # every page in the html_archive zips under dir, or synthetic ones if there aren't any
+    paths = []
+    pages = []
+    for zip_path in sorted(glob.glob(html_archive.archive_path('*', dir))):
+        season = int(zip_path.split('season_')[-1][:-len('.zip')])
+        for date in html_archive.archived_dates(season, dir):
+            paths.append(f"{zip_path}:{date}")
+            pages.append(html_archive.load_page(date, dir))
+    if len(pages) > 0:
+        return (paths, pages)
+    print(f"no archived pages in {dir}, using {days} days of synthetic pages")
+    synthetic_pages = synthetic.synthetic_pages(days=days)
+    return ([f"synthetic:{date}" for date in synthetic_pages], list(synthetic_pages.values()))
+
+def bench_parsers(paths=None, repeat=3, parsers=('bs4', 'lxml'), dir='sbr'):
+    """
+    Parse saved sportsbookreview pages with each parser, check they give the
+    exact same frames, and report the time per page. 
+
+    paths can be a list of files or a glob pattern like 'html/*.html'. By default it's
+    every page in the archive under `dir` (see html_archive), or synthetic pages from
+    synthetic.sbr_page if nothing's been archived yet.
+    """
+    if paths is None:
+        (paths, pages) = _default_pages(dir)
+    else:
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(paths))
+        pages = [open(path, 'rb').read() for path in paths]
+    if len(pages) == 0:
+        raise ValueError("no pages to parse")
+
+    timings = {}
+    results = {}
+    for parser in parsers:
+        best = None
+        for x in range(repeat):
+            start = time.perf_counter()
+            parsed = [scrape_sbr.scrape_a_page(page, parser=parser) for page in pages]
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        timings[parser] = best
+        results[parser] = parsed
+
+    ## parity: every parser has to match the first one exactly.
+    baseline = parsers[0]
+    for parser in parsers[1:]:
+        for (path, expected, got) in zip(paths, results[baseline], results[parser]):
+            try:
+                pd.testing.assert_frame_equal(expected, got)
+            except AssertionError as e:
+                raise AssertionError(f"{parser} doesn't match {baseline} on {path}") from e
+
+    report = pd.DataFrame({'seconds': pd.Series(timings)})
+    report['ms_per_page'] = 1000 * report.seconds / len(pages)
+    report['speedup'] = report.seconds[baseline] / report.seconds
+    print(f"parsed {len(pages)} pages, all parsers match")
+    print(report)
+    return report
+
+def memory_report(start=scrape_sbr.START_DATE, end=scrape_sbr.END_DATE, dir='sbr'):
+    """
+    Footprint of a season of clean_data, as plain python strings vs. the compact
+    categorical version (scrape_sbr.to_categorical). In bytes, per column.
+    """
+    before = scrape_sbr.clean_data(start=start, end=end, dir=dir)
+    after = scrape_sbr.clean_data(start=start, end=end, dir=dir, categorical=True)
+
+    report = pd.DataFrame({'before': before.memory_usage(deep=True),
+                           'after': after.memory_usage(deep=True),
+                           'after_dtype': after.dtypes.astype(str)})
+    report.loc['TOTAL', ['before', 'after']] = report[['before', 'after']].sum()
+    report['ratio'] = report.before / report.after
+
+    print(f"{len(before)} games: {report.loc['TOTAL', 'before'] / 1e6:.2f} MB -> "
+          f"{report.loc['TOTAL', 'after'] / 1e6:.2f} MB")
+    return report
+
+
+def measure(fn, repeat=1, memory=True):
+    """
+    Best wall time of `repeat` calls of fn(), and the peak memory (MB) python
+    allocated during one more call with tracemalloc on (tracing slows things
+    down, so it's not timed). Anything fn prints is thrown away.
+    """
+    best = None
+    peak_mb = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for x in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        if memory:
+            tracemalloc.start()
+            try:
+                fn()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+    return (best, peak_mb)
+
+## pipeline benchmarks: fn(start, end, dir) on a season that's already on disk.
+## each one starts from the csv files, not from clean_data's cache.
+def _cold(fn):
+    def run(start, end, dir):
+        scrape_sbr.invalidate_clean_data_cache(dir)
+        return fn(start, end, dir)
+    return run
+
+PIPELINE = {
+    'clean_data': _cold(lambda start, end, dir: scrape_sbr.clean_data(start, end, dir)),
+    'get_ats_for_range': _cold(lambda start, end, dir: scrape_sbr.get_ats_for_range(start, end, dir)),
+    'get_ats_for_range_window20': _cold(lambda start, end, dir: scrape_sbr.get_ats_for_range(start, end, dir, window=20)),
+    'get_money_for_range': _cold(lambda start, end, dir: scrape_sbr.get_money_for_range(start, end, dir)),
+    'superfade': _cold(lambda start, end, dir: fader.superfade(base_picks=scrape_sbr.clean_data(start, end, dir), dir=dir)),
+}
+
+## monte carlo benchmarks: fn(n) runs n trials with a fixed seed, in this process.
+## both go through experiments.run_trials, so every run does the same draws no matter
+## what ran before it, and timings are comparable across commits.
+MONTE_CARLO = {
+    'graded_vs_ungraded': lambda n: BetGrading().graded_vs_ungraded(n_trials=n, vectorized=True,
+                                                                     keep_losses=False, workers=1,
+                                                                     seed=2718),
+    'parlay_vs_straight': lambda n: intro.parlay_vs_straight(runs=n, vectorized=True, workers=1, seed=2718),
+}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(days=(40, 80, 160), trials=(1000, 10000, 100000), teams=30, games_per_day=8,
+              repeat=1, memory=True, pipeline=None, monte_carlo=None, out=None):
+    """
+    Run every benchmark at every size and return the results, one row per
+    (benchmark, size). `days` are the season lengths for the pipeline benchmarks,
+    `trials` the trial counts for the Monte Carlo ones. pipeline/monte_carlo pick
+    which benchmarks to run by name (default all).
+
+    out= also saves them as json, along with the commit and library versions.
+    """
+    rows = []
+    for name in (pipeline if pipeline is not None else PIPELINE):
+        for n_days in days:
+            with tempfile.TemporaryDirectory() as dir:
+                season = synthetic.synthetic_season(teams=teams, days=n_days,
+                                                    games_per_day=games_per_day)
+                (start, end) = synthetic.write_season(season, dir)
+                (seconds, peak_mb) = measure(lambda: PIPELINE[name](start, end, dir), repeat, memory)
+                scrape_sbr.invalidate_clean_data_cache(dir)
+            rows.append({'benchmark': name, 'kind': 'days', 'size': n_days,
+                         'games': n_days * games_per_day, 'seconds': seconds, 'peak_mb': peak_mb})
+            print(f"{name} {n_days} days: {seconds:.3f}s")
+
+    for name in (monte_carlo if monte_carlo is not None else MONTE_CARLO):
+        for n in trials:
+            (seconds, peak_mb) = measure(lambda: MONTE_CARLO[name](n), repeat, memory)
+            rows.append({'benchmark': name, 'kind': 'trials', 'size': n,
+                         'games': None, 'seconds': seconds, 'peak_mb': peak_mb})
+            print(f"{name} {n} trials: {seconds:.3f}s")
+
+    results = pd.DataFrame(rows)
+    if out is not None:
+        meta = {'commit': _git_commit(),
+                'when': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'machine': platform.machine()}
+        with open(out, 'w') as f:
+            json.dump({'meta': meta, 'results': results.to_dict(orient='records')}, f, indent=1)
+    return results
+
+def scaling(results):
+    """
+    How each benchmark grows with its size: the slope of log(seconds) vs. log(size).
+    About 1 is linear, 2 is quadratic.
+    """
+    slopes = {}
+    for (name, group) in results.groupby('benchmark', sort=False):
+        if group['size'].nunique() < 2:
+            continue
+        slopes[name] = np.polyfit(np.log(group['size']), np.log(group.seconds), 1)[0]
+    return pd.Series(slopes, name='exponent')
+
+def load_run(path):
+    with open(path) as f:
+        run = json.load(f)
+    return (run['meta'], pd.DataFrame(run['results']))
+
+def compare_runs(before, after):
+    """
+    Line up two saved runs. ratio > 1 means `after` is slower / uses more memory.
+    """
+    (before_meta, before) = load_run(before)
+    (after_meta, after) = load_run(after)
+    df = before.merge(after, on=['benchmark', 'kind', 'size'], suffixes=('_before', '_after'))
+    df = df[['benchmark', 'size', 'seconds_before', 'seconds_after', 'peak_mb_before', 'peak_mb_after']]
+    df['time_ratio'] = df.seconds_after / df.seconds_before
+    df['memory_ratio'] = df.peak_mb_after / df.peak_mb_before
+    print(f"{before_meta['commit']} -> {after_meta['commit']}")
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="benchmarks")
+    sub = arg_parser.add_subparsers(dest='command', required=True)
+    parsers = sub.add_parser('parsers', help="compare the scrape_a_page parsers on saved pages")
+    parsers.add_argument('paths', nargs='?', default=None,
+                         help="glob of html files (default: the archived pages, or synthetic ones)")
+    parsers.add_argument('--dir', default='sbr')
+    suite = sub.add_parser('suite', help="time the pipeline and the monte carlo experiments")
+    suite.add_argument('--days', type=int, nargs='+', default=[40, 80, 160])
+    suite.add_argument('--trials', type=int, nargs='+', default=[1000, 10000, 100000])
+    suite.add_argument('--repeat', type=int, default=1)
+    suite.add_argument('--no-memory', action='store_true', help="skip the (slower) peak memory runs")
+    suite.add_argument('--out', default=None, help="save the results to this json file")
+    compare = sub.add_parser('compare', help="compare two saved suite runs")
+    compare.add_argument('before')
+    compare.add_argument('after')
+    args = arg_parser.parse_args()
+
+    if args.command == 'parsers':
+        bench_parsers(args.paths, dir=args.dir)
+    elif args.command == 'suite':
+        results = run_suite(days=args.days, trials=args.trials, repeat=args.repeat,
+                            memory=not args.no_memory, out=args.out)
+        print(results.to_string())
+        print(scaling(results).to_string())
+    else:
+        print(compare_runs(args.before, args.after).to_string())
@@ -5,6 +5,8 @@ import numpy as np
 
 from io import StringIO
 
+import experiments
+
 class BetGrading:
     def __init__(self):
         self.rng = np.random.default_rng(2718)
@@ -36,21 +38,108 @@ class BetGrading:
         self.scramble_frequency = 0
 
     def create_df(self, num_bets):
-        results = []
         grades = self.rng.choice(list(self.grade_frequencies.keys()), 
                                  size=num_bets, 
                                  p=list(self.grade_frequencies.values()))
-        for x in range(num_bets):
-            grade = grades[x]
-            if self.rng.random() < self.thresholds[grade]:
-                results.append("W")
-            else:
-                results.append("L")
+        # one random number per bet, same as calling self.rng.random() in a loop
+        win_probs = np.array([self.thresholds[grade] for grade in grades])
+        results = np.where(self.rng.random(num_bets) < win_probs, "W", "L")
 
         graded_df = pd.DataFrame(dict(grades=grades, result=results))
 
         return graded_df
 
+    ### vectorized versions: every trial at once.
+    ### grades are stored as codes, the position in self.grade_frequencies.
+    ### a trial's "record" is its (wins, losses) for each grade -- that's all the scoring needs.
+
+    def grade_names(self):
+        return list(self.grade_frequencies.keys())
+
+    def create_trials(self, n_trials, num_bets, rng=None):
+        """
+        Like calling create_df n_trials times. Returns (grades, wins): grades is an
+        int array of grade codes, wins is a bool array, both shaped (n_trials, num_bets).
+        """
+        if rng is None:
+            rng = self.rng
+        names = self.grade_names()
+        grades = rng.choice(len(names), size=(n_trials, num_bets),
+                            p=list(self.grade_frequencies.values()))
+        win_probs = np.array([self.thresholds[name] for name in names])[grades]
+        wins = rng.random((n_trials, num_bets)) < win_probs
+        return (grades, wins)
+
+    def create_trial_records(self, n_trials, num_bets, rng=None):
+        """
+        Records for n_trials trials without drawing the individual bets: the number of
+        bets per grade is multinomial, and the wins within a grade are binomial. 
+        Same distribution as create_trials + trial_records, a lot less work.
+        """
+        if rng is None:
+            rng = self.rng
+        names = self.grade_names()
+        counts = rng.multinomial(num_bets, list(self.grade_frequencies.values()), size=n_trials)
+        won = rng.binomial(counts, [self.thresholds[name] for name in names])
+        return (won, counts - won)
+
+    def trial_records(self, grades, wins):
+        # (wins, losses) for each trial and grade, both shaped (n_trials, num_grades).
+        # one bincount over (trial, grade) pairs instead of a groupby per trial.
+        n_trials = grades.shape[0]
+        num_grades = len(self.grade_names())
+        cell = (np.arange(n_trials)[:, None] * num_grades) + grades
+
+        total = np.bincount(cell.ravel(), minlength=n_trials * num_grades)
+        won = np.bincount(cell[wins], minlength=n_trials * num_grades)
+        won = won.reshape(n_trials, num_grades)
+        return (won, total.reshape(n_trials, num_grades) - won)
+
+    def score_trials_with_grade(self, won, lost):
+        # score_bets_with_grade for every trial's record
+        units = np.array([self.units_map[name] for name in self.grade_names()])
+        units_won = ((won - (1.1 * lost)) * units).sum(axis=1)
+        return np.round(units_won, 2)
+
+    def score_trials_normally(self, won, lost, unit_multiplier=None):
+        # score_bets_normally for every trial's record
+        units_won = won.sum(axis=1) - (1.1 * lost.sum(axis=1))
+
+        if unit_multiplier is None:
+            unit_multiplier = (pd.Series(self.units_map) * pd.Series(self.grade_frequencies)).sum()
+        return np.round(unit_multiplier * units_won, 2)
+
+    def record_df(self, won, lost):
+        # a create_df style frame for one trial's record. the order is made up (shuffled
+        # with self.rng), since the vectorized trials only keep counts per grade.
+        names = self.grade_names()
+        grades = np.repeat(names + names, np.concatenate([won, lost]))
+        results = np.repeat(["W", "L"], [won.sum(), lost.sum()])
+        order = self.rng.permutation(len(grades))
+        return pd.DataFrame(dict(grades=grades[order], result=results[order]))
+
+    def scramble_trials(self, n, df_size, num_to_scramble, rng=None):
+        """
+        Vectorized test_some_grades: score n trials with their real grades, with
+        num_to_scramble grades randomly replaced, and flat.
+        """
+        if rng is None:
+            rng = self.rng
+        (grades, wins) = self.create_trials(n, df_size, rng=rng)
+
+        # Simulate imperfect grading: overwrite num_to_scramble random bets in each
+        # trial (with replacement, like before) with random weighted grades.
+        bad_grades = grades.copy()
+        idx_to_change = rng.integers(0, df_size, size=(n, num_to_scramble))
+        vals_to_change = rng.choice(len(self.grade_names()), size=(n, num_to_scramble),
+                                    p=list(self.grade_frequencies.values()))
+        bad_grades[np.arange(n)[:, None], idx_to_change] = vals_to_change
+
+        good_record = self.trial_records(grades, wins)
+        return pd.DataFrame({'good': self.score_trials_with_grade(*good_record),
+                             'bad': self.score_trials_with_grade(*self.trial_records(bad_grades, wins)),
+                             'flat': self.score_trials_normally(*good_record),
+                             'fraction_agree': (bad_grades == grades).mean(axis=1)})
 
     def score_bets_with_grade(self, base_df):
         record = base_df.groupby("grades").value_counts()
@@ -103,14 +192,44 @@ class BetGrading:
         # rounding prevents ugly floating point stuff
         return round(unit_multiplier * units_won, 2)    
 
-    def graded_vs_ungraded(self, perturb=False):
+    def graded_vs_ungraded(self, perturb=False, n_trials=1000, vectorized=False, keep_losses=True,
+                           workers=None, seed=2718):
+        """
+        vectorized=False (the default) is the original one-DataFrame-per-trial loop,
+        drawing from self.rng like it always has.
+
+        vectorized=True draws each trial's record (wins/losses per grade) directly and
+        scores all the trials at once, which is fast enough for 10^6 trials. It's a
+        different random stream, so the numbers won't match the loop's, just the
+        distribution. The records come from experiments.run_trials, so they only depend
+        on `seed` (workers=k draws them over k processes). The losing trials it returns
+        are rebuilt from each trial's record by record_df: the right grades and results,
+        but in a random order, not the sequence of bets that was drawn. (use
+        keep_losses=False for big runs, otherwise every losing trial becomes a DataFrame.)
+        """
+        if vectorized:
+            (won, lost) = experiments.run_trials(_record_block, n_trials, block_size=100000,
+                                                 seed=seed, workers=workers, grading=self)
+            with_grade = self.score_trials_with_grade(won, lost)
+            normally = self.score_trials_normally(won, lost)
+            diffs = with_grade - normally
+
+            losses = []
+            if keep_losses:
+                losses = [self.record_df(won[trial], lost[trial]) 
+                          for trial in np.flatnonzero(with_grade < normally)]
+
+            print(f"wins: {np.sum(diffs > 0)}, losses: {np.sum(diffs < 0)}, ties: {np.sum(diffs == 0)}")
+            print(f"mean diff: { np.mean(diffs) }")
+            return list(diffs), losses
+
         grade_wins = 0
         grade_losses = 0
         grade_ties = 0
         diffs = []
         losses = []
 
-        for x in range(1000):
+        for x in range(n_trials):
             base_df = self.create_df(self.df_size)
             multi = self.get_unit_multiplier(base_df)
                 
@@ -131,7 +250,14 @@ class BetGrading:
         print(f"mean diff: { np.mean(diffs) }")
         return diffs, losses
 
-    def test_some_grades(self, n, df_size, num_to_scramble):
+    def test_some_grades(self, n, df_size, num_to_scramble, vectorized=False, workers=None, seed=2718):
+        # vectorized=True is scramble_trials through experiments.run_trials: same columns,
+        # much faster, but a different random stream (it only depends on `seed`).
+        if vectorized:
+            return experiments.run_trials(_scramble_block, n, block_size=1000, seed=seed, 
+                                          workers=workers, grading=self, df_size=df_size,
+                                          num_to_scramble=num_to_scramble)
+
         good = []
         bad = []
         normal = []
@@ -168,3 +294,12 @@ class BetGrading:
             bad.append(bad_score)
         return pd.DataFrame({'good': good, 'bad': bad, 'flat': normal, 
                              'fraction_agree': fraction_agree})
+
+
+def _record_block(n_trials, rng, grading):
+    # one block of trial records for experiments.run_trials
+    return grading.create_trial_records(n_trials, grading.df_size, rng=rng)
+
+def _scramble_block(n, rng, grading, df_size, num_to_scramble):
+    # one block of test_some_grades trials for experiments.run_trials
+    return grading.scramble_trials(n, df_size, num_to_scramble, rng=rng)
@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import binom
+
+from bankroll import kelly_fraction
+
+"""
+Exact answers for the betting experiments, with no sampling noise. Use these to check
+the Monte Carlo versions (intro.simulate_parlays, bankroll.simulate_bankroll,
+RandomWalk.walk_summaries), or when you care about the tails, where simulating
+needs millions of runs.
+
+Instead of simulating paths, these carry the whole probability distribution forward
+one bet at a time:
+
+    flat_bets         -- P&L of n flat bets is just binomial
+    parlay_vs_straight -- joint distribution of (parlays won, straight bets won)
+    walk_ruin         -- RandomWalk ruin: a lattice with an absorbing floor
+    bankroll          -- bankroll.simulate_chunk's rules on a grid of bankroll values
+
+Distributions come back as a Series of probabilities indexed by P&L (or bankroll).
+"""
+
+def quantiles(dist, qs=(.01, .05, .25, .5, .75, .95, .99)):
+    # smallest value where the cumulative probability reaches q
+    values = dist.index.to_numpy()
+    cdf = np.cumsum(dist.to_numpy())
+    picks = np.minimum(np.searchsorted(cdf, np.asarray(qs) - 1e-12), len(values) - 1)
+    return pd.Series(values[picks], index=qs)
+
+def mean(dist):
+    return float(np.dot(dist.index.to_numpy(), dist.to_numpy()))
+
+def std(dist):
+    values = dist.index.to_numpy()
+    return float(np.sqrt(max(0, np.dot(values ** 2, dist.to_numpy()) - mean(dist) ** 2)))
+
+
+def flat_bets(n, skill=.5, vig=1.1, stake=1):
+    """
+    P&L distribution for n bets of `stake` that lose `vig` * stake, won with probability skill.
+    """
+    wins = np.arange(n + 1)
+    pnl = stake * (wins - (vig * (n - wins)))
+    return pd.Series(binom.pmf(wins, n, skill), index=pnl)
+
+
+def _parlay_kernel(skill, legs, throw_one_out, random_fourth_bet):
+    # [parlay won, straight bets won] for one parlay's worth of legs
+    kernel = np.zeros((2, legs + 1))
+    first_legs = binom.pmf(np.arange(legs), legs - 1, skill)
+    for (k, p_k) in enumerate(first_legs):
+        for (last, p_last) in [(1, skill), (0, 1 - skill)]:
+            parlay = int(k == legs - 1 and last == 1)
+            if throw_one_out and not random_fourth_bet:
+                kernel[parlay, k] += p_k * p_last
+            elif random_fourth_bet:
+                # the straight bet is a coin flip instead of the last leg
+                kernel[parlay, k] += p_k * p_last * .5
+                kernel[parlay, k + 1] += p_k * p_last * .5
+            else:
+                kernel[parlay, k + last] += p_k * p_last
+    return kernel
+
+def parlay_vs_straight(skill=.55, num_parlays=50, payout=1228.33, vig=1.1, legs=4, throw_one_out=False,
+                       random_fourth_bet=False, same_total_risk=True, max_states=10**8, silent=False):
+    """
+    Exact version of intro.parlay_vs_straight / simulate_parlays: the chance that the
+    parlays beat the straight bets and so on, instead of counts out of `runs`.
+
+    The parlays and straight bets share legs, so this keeps their joint distribution,
+    (num_parlays + 1) x (num_parlays * legs + 1) states. Returns (summary, parlay P&L
+    distribution, straight P&L distribution).
+    """
+    if (num_parlays + 1) * (num_parlays * legs + 1) > max_states:
+        raise ValueError(f"{num_parlays} parlays is too many for the joint distribution, "
+                         "use flat_bets for each side on its own")
+    if same_total_risk:
+        one_straight_loss = 100 / legs
+        one_straight_win = one_straight_loss / vig
+    else:
+        one_straight_loss = 100
+        one_straight_win = 100 / vig
+
+    kernel = _parlay_kernel(skill, legs, throw_one_out, random_fourth_bet)
+    joint = np.zeros((num_parlays + 1, (num_parlays * legs) + 1))
+    joint[0, 0] = 1
+    for n in range(num_parlays):
+        # add one more parlay: only the corner we could have reached so far is non-zero
+        reached = joint[:n + 1, :(n * legs) + 1].copy()
+        joint[:n + 2, :((n + 1) * legs) + 1] = 0
+        for (parlay, straight) in zip(*np.nonzero(kernel)):
+            joint[parlay:parlay + n + 1, straight:straight + (n * legs) + 1] += kernel[parlay, straight] * reached
+
+    straight_bets = num_parlays * (legs - 1)
+    if random_fourth_bet or not throw_one_out:
+        straight_bets += num_parlays
+    parlay_wins = np.arange(num_parlays + 1)
+    straight_wins = np.arange(joint.shape[1])
+    parlay_pnl = (parlay_wins * payout) - ((num_parlays - parlay_wins) * 100)
+    straight_pnl = (straight_wins * one_straight_win) - ((straight_bets - straight_wins) * one_straight_loss)
+
+    parlay_ahead = parlay_pnl[:, None] > straight_pnl[None, :]
+    straight_ahead = parlay_pnl[:, None] < straight_pnl[None, :]
+    parlay_dist = pd.Series(joint.sum(axis=1), index=parlay_pnl)
+    straight_dist = pd.Series(joint.sum(axis=0), index=straight_pnl).sort_index()
+    summary = {'parlay_wins': joint[parlay_ahead].sum(),
+               'straight_wins': joint[straight_ahead].sum(),
+               'parlay_big_losses': parlay_dist[parlay_dist.index < -1000].sum(),
+               'straight_big_losses': straight_dist[straight_dist.index < -1000].sum(),
+               'parlays_made_money': parlay_dist[parlay_dist.index > 0].sum(),
+               'straights_made_money': straight_dist[straight_dist.index > 0].sum()}
+    if not silent:
+        print(f"parlay wins: {100 * summary['parlay_wins']:.3f}%, straight: {100 * summary['straight_wins']:.3f}%")
+        print(f"parlay big losses: {100 * summary['parlay_big_losses']:.3f}%, "
+              f"straight big losses: {100 * summary['straight_big_losses']:.3f}%")
+        print(f"parlays made money: {100 * summary['parlays_made_money']:.3f}%, "
+              f"straights: {100 * summary['straights_made_money']:.3f}%")
+    return (summary, parlay_dist, straight_dist)
+
+
+def _lattice_scale(vig):
+    # same as RandomWalk._scale: smallest power of 10 that makes the vig a whole number
+    for scale in [1, 10, 100, 1000]:
+        if np.isclose(vig * scale, np.round(vig * scale)):
+            return scale
+    raise ValueError(f"vig {vig} needs too fine a lattice")
+
+def walk_ruin(p, n, ruin, vig=1.1):
+    """
+    Chance a RandomWalk (win +1, lose -vig) has been down `ruin` units or more by each
+    bet. Index is the bet number counting from 0, like summarize_walks' ruin_step, so
+    the last value is the chance ruin_step != -1.
+    """
+    scale = _lattice_scale(vig)
+    win = scale
+    lose = int(round(vig * scale))
+    floor = int(np.ceil(ruin * scale))
+
+    # position + offset, where offset puts the floor at 0. anything at or below it is ruined
+    offset = floor
+    dist = np.zeros(offset + (n * win) + 1)
+    dist[offset] = 1
+    ruined = np.zeros(n)
+    for step in range(n):
+        moved = np.zeros_like(dist)
+        moved[win:] += p * dist[:-win]
+        moved[:-lose] += (1 - p) * dist[lose:]
+        # losses from less than one loss above the floor end up below it
+        moved[0] += (1 - p) * dist[1:lose].sum()
+        ruined[step] = moved[0]
+        moved[0] = 0
+        dist = moved
+    return pd.Series(np.cumsum(ruined), index=np.arange(n))
+
+
+class ExactBankroll:
+    """
+    The distribution of outcomes for bankroll.simulate_bankroll's settings, worked out
+    on a grid of bankroll values. Has the same methods as bankroll.BankrollStats, so the
+    two can be checked against each other.
+
+    Flat bets sit exactly on the grid, except right above the ruin level, where the bet
+    shrinks to what's left and a win lands between grid points. Percent and Kelly bets
+    use a grid that's even in log(bankroll), so most bets land between grid points.
+    Either way, that probability is split between the two closest grid points (which
+    keeps the mean right). `interpolated` adds up the probability that got split over
+    every game, so 0 means the answer is exact, and it can be more than 1.
+    """
+    def __init__(self, values, final, ruin_games, init_bankroll, interpolated):
+        self.values = values
+        self.final = final
+        self.ruin_games = ruin_games
+        self.games = len(ruin_games)
+        self.init_bankroll = init_bankroll
+        self.interpolated = interpolated
+
+    def distribution(self):
+        keep = self.final > 0
+        return pd.Series(self.final[keep], index=self.values[keep])
+
+    def ruin_probability(self):
+        return self.ruin_games.sum()
+
+    def ruin_curve(self):
+        return pd.Series(np.cumsum(self.ruin_games), index=np.arange(1, self.games + 1))
+
+    def profit_probability(self):
+        return self.final[self.values > self.init_bankroll].sum()
+
+    def mean(self):
+        return mean(self.distribution())
+
+    def std(self):
+        return std(self.distribution())
+
+    def quantiles(self, qs=(.01, .05, .25, .5, .75, .95, .99)):
+        return quantiles(self.distribution(), qs)
+
+    def report(self):
+        print(f"Exact, {self.games} games")
+        print(f"We went broke {100 * self.ruin_probability():.3f}% of the time")
+        print(f"made money {100 * self.profit_probability():.2f}% of the time")
+        print(f"mean {self.mean():,.2f}, std {self.std():,.2f}, median {self.quantiles([.5]).iloc[0]:,.2f}")
+
+
+def bankroll(games=1000, init_bankroll=1000, skill=.56, vig=1.1, sizing='flat', bet_size=20,
+             ruin_level=0, grid_step=None, log_bins_per_bet=20):
+    """
+    Exact(ish, see ExactBankroll) version of bankroll.simulate_bankroll, same settings and
+    rules: bets can't lose more than what's left, and a bankroll at or below ruin_level
+    stops betting.
+
+    Flat bets use a grid of grid_step (default: the smallest step that both a win and a
+    loss land on). Percent/Kelly bets use a log grid with log_bins_per_bet grid points per
+    winning bet.
+    """
+    if sizing == 'flat':
+        if grid_step is None:
+            grid_step = bet_size / _lattice_scale(vig)
+        values = np.arange(0, init_bankroll + (games * bet_size) + grid_step, grid_step)
+        stake = np.minimum(bet_size, values / vig)
+    else:
+        if sizing == 'kelly':
+            fraction = bet_size * kelly_fraction(skill, vig)
+            if fraction <= 0:
+                raise ValueError("no edge, kelly says don't bet")
+        elif sizing == 'percent':
+            fraction = bet_size
+        else:
+            raise ValueError(f"unknown bet sizing {sizing}")
+        # bankroll can only move by these factors, so this covers everywhere it can get to
+        up = np.log1p(fraction)
+        down = np.log(max(1 - (vig * fraction), 1e-300))
+        step = up / log_bins_per_bet
+        low = max(games * down, np.log(max(ruin_level, 1e-300) / init_bankroll) - up)
+        exponents = np.arange(np.floor(low / step), np.ceil(games * up / step) + 1) * step
+        values = np.concatenate([[0.0], init_bankroll * np.exp(exponents)])
+        stake = np.minimum(fraction * values, values / vig)
+
+    start = np.argmin(np.abs(values - init_bankroll))
+    if not np.isclose(values[start], init_bankroll):
+        raise ValueError("init_bankroll isn't on the grid, pass a grid_step that divides it")
+
+    win_to = values + stake
+    lose_to = np.maximum(values - (vig * stake), 0)
+    alive = values > ruin_level
+
+    def where(targets):
+        # grid position of each target, as (lower index, weight on the upper one)
+        upper = np.clip(np.searchsorted(values, targets - 1e-9), 0, len(values) - 1)
+        lower = np.maximum(upper - 1, 0)
+        gap = values[upper] - values[lower]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(gap > 0, (targets - values[lower]) / gap, 0)
+        on_grid = np.isclose(values[upper], targets, rtol=0, atol=1e-9 * max(1, init_bankroll))
+        weight[on_grid] = 1
+        lower[on_grid] = upper[on_grid]
+        return (lower, upper, np.clip(weight, 0, 1), ~on_grid)
+
+    (win_low, win_high, win_weight, win_split) = where(win_to)
+    (lose_low, lose_high, lose_weight, lose_split) = where(lose_to)
+
+    dist = np.zeros(len(values))
+    dist[start] = 1
+    # paths that went broke stay where they were when they did, like simulate_chunk
+    stopped = np.zeros(len(values))
+    ruin_games = np.zeros(games)
+    interpolated = 0.0
+    n = len(values)
+    for game in range(games):
+        won = skill * dist
+        lost = (1 - skill) * dist
+        interpolated += won[win_split].sum() + lost[lose_split].sum()
+        dist = (np.bincount(win_low, weights=won * (1 - win_weight), minlength=n)
+                + np.bincount(win_high, weights=won * win_weight, minlength=n)
+                + np.bincount(lose_low, weights=lost * (1 - lose_weight), minlength=n)
+                + np.bincount(lose_high, weights=lost * lose_weight, minlength=n))
+        went_broke = np.where(alive, 0, dist)
+        ruin_games[game] = went_broke.sum()
+        stopped += went_broke
+        dist = np.where(alive, dist, 0)
+
+    return ExactBankroll(values, dist + stopped, ruin_games, init_bankroll, interpolated)
@@ -0,0 +1,64 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+"""
+Runs Monte Carlo experiments over a pool of processes.
+
+The trials get split into fixed-size blocks, and block i always gets the i-th child of
+SeedSequence(seed).spawn(). So each block has its own independent random stream, and
+the merged result is bit-for-bit the same whether it ran on 1 worker or 32 -- only the
+seed and block_size matter.
+
+A block function looks like block_fn(n, rng, **kwargs) and returns the partial result
+for n trials. It has to be a module-level function (or a functools.partial of one) so
+it can be sent to the worker processes.
+"""
+
+def block_sizes(n_trials, block_size):
+    return [min(block_size, n_trials - start) for start in range(0, n_trials, block_size)]
+
+def _run_block(block_fn, n, seed, kwargs):
+    return block_fn(n, np.random.default_rng(seed), **kwargs)
+
+def merge_results(parts):
+    """
+    Default way to put the blocks back together, in block order: arrays and lists are
+    concatenated, DataFrames/Series are concatenated, tuples are merged element by element,
+    and anything with a merge() method (eg bankroll.BankrollStats) gets folded together.
+    """
+    first = parts[0]
+    if isinstance(first, tuple):
+        return tuple(merge_results(list(column)) for column in zip(*parts))
+    if isinstance(first, np.ndarray):
+        return np.concatenate(parts)
+    if isinstance(first, (pd.DataFrame, pd.Series)):
+        return pd.concat(parts, ignore_index=True)
+    if isinstance(first, list):
+        return [item for part in parts for item in part]
+    if hasattr(first, 'merge'):
+        return reduce(lambda merged, part: merged.merge(part), parts[1:], first)
+    raise TypeError(f"don't know how to merge {type(first)}, pass merge=")
+
+def run_trials(block_fn, n_trials, block_size=1000, seed=2718, workers=None, merge=merge_results, **kwargs):
+    """
+    Run n_trials trials of block_fn, block_size trials per block.
+
+    workers=None runs every block here in this process. workers=k fans the blocks out
+    over k processes. The answer is the same either way.
+    """
+    sizes = block_sizes(n_trials, block_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is None or workers == 1:
+        parts = [_run_block(block_fn, n, block_seed, kwargs) for (n, block_seed) in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_block, block_fn, n, block_seed, kwargs)
+                       for (n, block_seed) in zip(sizes, seeds)]
+            # collect in block order, not the order they finish in
+            parts = [future.result() for future in futures]
+
+    return merge(parts)
@@ -1,9 +1,13 @@
 
+import numpy as np
 import pandas as pd
 
 import datetime
+from itertools import product
 
+import resampling
 import scrape_sbr
+import win_loss_report
 
 
 def daily_picks():
@@ -67,14 +71,53 @@ def fade_the_public(lower_thresh = 50, upper_thresh=60, games=None):
     df.loc[above_thresh, 'fade_pick'] = df.loc[above_thresh, 'home_names']
     df.loc[above_thresh, 'fade_vs'] = df.loc[above_thresh, 'away_names']
 
+    if isinstance(games.away_names.dtype, pd.CategoricalDtype):
+        # keep the compact dtypes from clean_data(categorical=True)
+        df['fade'] = df['fade'].astype(scrape_sbr.SIDE_DTYPE)
+        df['fade_pick'] = df['fade_pick'].astype(games.away_names.dtype)
+        df['fade_vs'] = df['fade_vs'].astype(games.away_names.dtype)
+
     # drop rows where it's 50-50. these might be interesting at some point.
     return df[df.away_percents != 50].copy()
 
 
+def date_index(picks):
+    """
+    Group the rows of picks by game_date once. Returns a function that gives
+    the rows for one date (in their original order), so a loop over the days
+    only ever looks at that day's games.
+    """
+    rows_by_date = picks.groupby('game_date', sort=False, observed=True).indices
+    no_rows = picks.iloc[[]]
+
+    def picks_on(date):
+        rows = rows_by_date.get(date)
+        if rows is None:
+            return no_rows
+        return picks.iloc[rows]
+    return picks_on
+
+def ats_exclusions(ranks, eliminate_top):
+    """
+    teams x days masks of the teams superfade won't pick against (top) or pick (bottom),
+    from a RankMatrix of ats_win_pct. Row i is ranks.teams[i], column j is ranks.days[j].
+    """
+    if eliminate_top < 1:
+        ### option 1. filter by win percentage
+        return (ranks.above_mask(eliminate_top), ranks.below_mask(1 - eliminate_top))
+    ### option 2: filter by top n teams and bottom _n_teams
+    return (ranks.top_mask(eliminate_top), ranks.bottom_mask(eliminate_top))
+
+
 def superfade(eliminate_top=5, lower_thresh=49, upper_thresh=60, base_picks=None,
               ats_record=None, window=20, dir='sbr'):
     """
     This is the "fade the public" strategy but filtering out teams that are good/bad vs the spread
+
+    With a whole number eliminate_top, teams tied on ats_win_pct at the cutoff get broken
+    alphabetically (see scrape_sbr.RankMatrix). Before RankMatrix it was whichever order
+    sort_values left them in, so picks from older notebooks can differ on days with a tie
+    at the cutoff. A fraction (eliminate_top < 1) is a threshold, so ties don't matter.
     """
     if base_picks is None:
         base_picks = fade_the_public(lower_thresh, upper_thresh)
@@ -96,38 +139,35 @@ def superfade(eliminate_top=5, lower_thresh=49, upper_thresh=60, base_picks=None
         ### FIXME: this shouldn't use the 'dir' argument. pass in the base_picks.
         ats_by_date = scrape_sbr.get_ats_for_range(start=min_date, end=max_date, dir=dir, window=window) 
     # note: this isn't ideal, we're getting days we don't need to 
+    picks_on = date_index(base_picks)
+    ranks = scrape_sbr.RankMatrix(ats_by_date, 'ats_win_pct')
+    (top_mask, bottom_mask) = ats_exclusions(ranks, eliminate_top)
     prev_day = None
-    for (d, ats) in ats_by_date.items():
+    for (j, d) in enumerate(ats_by_date.keys()):
         # we have to lag by one day here so we're not using today's standings to bet on 
         # today's results.
         if prev_day is None:
-            prev_day = ats
+            prev_day = j
             continue # we have to skip the first day
         else:
-            if eliminate_top < 1:
-                ### option 1. filter by win percentage
-                top_ats_teams = prev_day[prev_day.ats_win_pct > eliminate_top].sort_values('ats_win_pct', ascending=False)
-                bottom_ats_teams = prev_day[prev_day.ats_win_pct < (1 - eliminate_top)].sort_values('ats_win_pct', ascending=False)
-
-            else:
-                ### option 2: filter by top n teams and bottom _n_teams
-                top_ats_teams = prev_day.sort_values('ats_win_pct', ascending=False)[:eliminate_top]
-                bottom_ats_teams = prev_day.sort_values('ats_win_pct',ascending=True)[:eliminate_top]
-            
+            top_teams = set(ranks.teams[top_mask[:, prev_day]])
+            bottom_teams = set(ranks.teams[bottom_mask[:, prev_day]])
+
             # don't pick against the teams with the best recordw against the spread.
             # don't pick for teams with the worst records against the spread.
-            sel = (base_picks.game_date == d) & (~base_picks.fade_vs.isin(top_ats_teams.index) & \
-                                                  (~base_picks.fade_pick.isin(bottom_ats_teams.index)))
+            day_picks = picks_on(d)
+            sel = ~day_picks.fade_vs.isin(top_teams) & ~day_picks.fade_pick.isin(bottom_teams)
 
-            today_picks = base_picks[sel]
+            today_picks = day_picks[sel]
             good_picks.append(today_picks)
-            prev_day = ats
+            prev_day = j
 
-        superfade = pd.concat(good_picks, ignore_index=True)
+    superfade = pd.concat(good_picks, ignore_index=True)
     return superfade.dropna(subset=['fade'])
 
 
 def superfade_money(base_picks, dir, eliminate_top=3):
+    # ties in the money percents at the cutoff go alphabetically (RankMatrix), like superfade
     ### FIXME: thresholds hardcoded
     base_picks = fade_the_public(49,60, games=base_picks)
 
@@ -139,17 +179,19 @@ def superfade_money(base_picks, dir, eliminate_top=3):
 
     ## FIXME: get_money_for_range should have base_picks passed in 'dir' argument bad!!!!!!
     money_by_date = scrape_sbr.get_money_for_range(start=min_date, end=max_date, dir=dir)
-    for (d, money) in money_by_date.items():
+    picks_on = date_index(base_picks)
+    ranks = scrape_sbr.RankMatrix(money_by_date)
+    for d in money_by_date.keys():
         # find the good picks on this day alone
-        top_money_teams = money.sort_values(ascending=False)[:eliminate_top]
-        exclude = top_money_teams.keys()
+        exclude = set(ranks.top(d, eliminate_top))
         #print(f"excluding {exclude}")
 
         #FIXME; this isn't right
         # throwing out picks where we're taking the home team, but they're too popular.
         #sel = (base_picks.game_date == d) & (~(base_picks.home_names.isin(exclude) & (base_picks.fade == "HOME")  ))
-        sel = (base_picks.game_date == d) & (~(base_picks.home_names.isin(exclude)))
-        today_picks = base_picks[sel]
+        day_picks = picks_on(d)
+        sel = ~day_picks.home_names.isin(exclude)
+        today_picks = day_picks[sel]
         good_picks.append(today_picks)
     superfade = pd.concat(good_picks, ignore_index=True)
     return superfade         
@@ -183,13 +225,107 @@ def superfade_money(base_picks, dir, eliminate_top=3):
         superfade = pd.concat(good_picks, ignore_index=True)
     """
 
-def analyze_fade(df):
+def _superfade_exclusions(ranks, eliminate_top):
+    # every (date, team) pair superfade would filter out, for the whole range at once.
+    # same one day lag as superfade, so the first day has no picks at all.
+    days = np.array(ranks.days, dtype=object)
+    pairs = []
+    for mask in ats_exclusions(ranks, eliminate_top):
+        (teams, prev_days) = np.nonzero(mask[:, :-1])
+        pairs.append(pd.MultiIndex.from_arrays([days[prev_days + 1], ranks.teams[teams]],
+                                               names=['game_date', 'team']))
+    return (ranks.days[1:], pairs[0], pairs[1])
+
+def _superfade_mask(picks, exclusions):
+    # which rows of fade_the_public output superfade would keep
+    (days, top_pairs, bottom_pairs) = exclusions
+    against = pd.MultiIndex.from_arrays([picks.game_date, picks.fade_vs.astype(object)])
+    taking = pd.MultiIndex.from_arrays([picks.game_date, picks.fade_pick.astype(object)])
+    return (picks.game_date.isin(days) & ~against.isin(top_pairs) & ~taking.isin(bottom_pairs)
+            & picks.fade.notna()).to_numpy()
+
+def _record(picks):
+    # same counting as win_loss_from_df: pushes don't count either way.
+    graded = picks[picks.winner_ats.notna()]
+    wins = int((graded.fade == graded.winner_ats).sum())
+    return (wins, len(graded) - wins)
+
+def _perm_p(picks, n_perm, method):
+    if n_perm == 0:
+        return {}
+    return {'perm_p': resampling.permutation_test(picks, n_perm, method=method)['p_value']}
+
+def sweep_superfade(eliminate_top=(3, 5, 7), lower_thresh=(49,), upper_thresh=(60,), window=(None, 20),
+                    start=scrape_sbr.START_DATE, end=scrape_sbr.END_DATE, dir='sbr', games=None,
+                    include_fade=True, adjust='bh', n_perm=0, perm_method='shuffle'):
+    """
+    Backtest every combination of the superfade parameters in one go.
+
+    The season gets cleaned once, fade_the_public runs once per pair of thresholds,
+    the standings (and their RankMatrix) are built once per window, and the teams to
+    filter out are figured out once per (window, eliminate_top). Each grid point is then just a mask over the picks.
+    Gives the same picks as calling superfade() for each combination.
+
+    Returns one row per combination with the record and the win_loss_report numbers
+    (win_loss_table), with the p-values adjusted for the size of the grid (adjust=).
+    n_perm > 0 adds perm_p, resampling.permutation_test's p-value for each combination.
+    With include_fade, there's also a row for plain fade_the_public at each pair of
+    thresholds (strategy 'fade', no window or eliminate_top).
+    """
+    if games is None:
+        games = scrape_sbr.clean_data(start, end, dir)
+
+    standings = {}
+    exclusions = {}
+    rows = []
+    for (lower, upper) in product(lower_thresh, upper_thresh):
+        picks = fade_the_public(lower, upper, games=games)
+
+        if include_fade:
+            fade_picks = picks.dropna(subset=['fade'])
+            (wins, losses) = _record(fade_picks)
+            rows.append({'strategy': 'fade', 'lower_thresh': lower, 'upper_thresh': upper,
+                         'window': None, 'eliminate_top': None, 'wins': wins, 'losses': losses,
+                         **_perm_p(fade_picks, n_perm, perm_method)})
+
+        # superfade gets the standings for the range its picks cover
+        dates = (picks.game_date.min(), picks.game_date.max())
+        for w in window:
+            if (w, dates) not in standings:
+                ats_by_date = scrape_sbr.get_ats_for_range(start=dates[0], end=dates[1], dir=dir, window=w)
+                standings[(w, dates)] = scrape_sbr.RankMatrix(ats_by_date, 'ats_win_pct')
+            for top in eliminate_top:
+                if (w, dates, top) not in exclusions:
+                    exclusions[(w, dates, top)] = _superfade_exclusions(standings[(w, dates)], top)
+                kept = picks[_superfade_mask(picks, exclusions[(w, dates, top)])]
+
+                (wins, losses) = _record(kept)
+                rows.append({'strategy': 'superfade', 'lower_thresh': lower, 'upper_thresh': upper,
+                             'window': w, 'eliminate_top': top, 'wins': wins, 'losses': losses,
+                             **_perm_p(kept, n_perm, perm_method)})
+
+    grid = pd.DataFrame(rows)
+    stats = win_loss_report.win_loss_table(grid.wins.to_numpy(), grid.losses.to_numpy(), adjust=adjust)
+    table = pd.concat([grid.drop(columns=['wins', 'losses']), stats], axis=1)
+    if 'perm_p' in table:
+        # keep the permutation p-value at the end with the others
+        table['perm_p'] = table.pop('perm_p')
+    return table
+
+
+def analyze_fade(df, bootstrap=0, by_date=False, ci=.95):
+    """
+    Record and units for every team we picked (and picked against).
+
+    bootstrap=n adds {column}_lo / {column}_hi confidence intervals from n resamples
+    of the games (by_date=True resamples whole dates), see resampling.bootstrap_fade.
+    """
 
-    win_counts = df[df.winner_ats == df.fade].fade_pick.value_counts()
-    lose_counts = df[df.winner_ats != df.fade].fade_pick.value_counts()
+    win_counts = scrape_sbr.observed_value_counts(df[df.winner_ats == df.fade].fade_pick)
+    lose_counts = scrape_sbr.observed_value_counts(df[df.winner_ats != df.fade].fade_pick)
 
-    win_against_counts = df[df.winner_ats == df.fade].fade_vs.value_counts()
-    lose_against_counts = df[df.winner_ats != df.fade].fade_vs.value_counts()
+    win_against_counts = scrape_sbr.observed_value_counts(df[df.winner_ats == df.fade].fade_vs)
+    lose_against_counts = scrape_sbr.observed_value_counts(df[df.winner_ats != df.fade].fade_vs)
 
     super_df = pd.DataFrame({'win': win_counts,
                               'lose': lose_counts,
@@ -211,4 +347,12 @@ def analyze_fade(df):
 
     super_df['total_units'] = super_df['units'] + super_df['win_units_against']
 
+    if bootstrap > 0:
+        (intervals, overall) = resampling.bootstrap_fade(df, n_boot=bootstrap, by_date=by_date, ci=ci)
+        intervals = intervals.reindex(super_df.index.astype(object))
+        intervals.index = super_df.index
+        for col in super_df.columns:
+            super_df[f"{col}_lo"] = intervals[f"{col}_lo"]
+            super_df[f"{col}_hi"] = intervals[f"{col}_hi"]
+
     return super_df
\ No newline at end of file
@@ -0,0 +1,177 @@
+import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # windows. only the in-process lock then.
+    fcntl = None
+
+import season_store
+
+"""
+Keeps the raw sportsbookreview pages so we can re-parse them later without
+downloading everything again.
+
+One zip file per season ({dir}/raw/season_2024.zip), with one compressed member
+per day, named by date (2024-10-22.html). get_for_date saves every page it scrapes
+in here. If a day gets scraped again, the newer page replaces the old one. (Archives
+written before that can have a day twice; reading always gets the last one, which
+is the newest.)
+
+Every save writes a new copy of the zip next to the old one and renames it over,
+under a lock file ({dir}/raw/season_2024.zip.lock), so two scrapers (eg the cli and
+picks_service) can't corrupt it and readers never see half a zip.
+
+To rebuild every daily csv from the archive (eg after fixing the parser):
+
+    python html_archive.py reparse 2024 --dir sbr --processes 8
+"""
+
+## zipfile can't have two writers at once, so one lock per archive file. (the lock
+## file handles other processes, this handles threads in this one.)
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def archive_path(season, dir='sbr'):
+    return f"{dir}/raw/season_{season}.zip"
+
+def _lock_for(path):
+    with _locks_lock:
+        if path not in _locks:
+            _locks[path] = threading.Lock()
+        return _locks[path]
+
+@contextmanager
+def _file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _copy_without(path, tmp_path, name):
+    # copy the archive, leaving out every member called `name`
+    with zipfile.ZipFile(path) as old, \
+            zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as new:
+        for info in old.infolist():
+            if info.filename != name:
+                new.writestr(info, old.read(info))
+
+def save_page(date, data, dir='sbr'):
+    """
+    Add the raw html for a date to its season's archive, replacing the page
+    that was there for that date.
+    """
+    season = season_store.season_for_date(date)
+    path = archive_path(season, dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    name = f"{date}.html"
+    tmp_path = f"{path}.tmp"
+    with _lock_for(path), _file_lock(path):
+        if os.path.exists(path):
+            with zipfile.ZipFile(path) as zf:
+                rescraped = name in zf.NameToInfo
+            if rescraped:
+                # only has to recompress when a day gets scraped again
+                _copy_without(path, tmp_path, name)
+            else:
+                shutil.copyfile(path, tmp_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with zipfile.ZipFile(tmp_path, 'a', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+            zf.writestr(name, data)
+        os.replace(tmp_path, path)
+
+def load_page(date, dir='sbr'):
+    # raw html for one date, or None if we never saved it. (zipfile gives back the last
+    # member with a name, so a day that's in an old archive twice gets the newest page.)
+    path = archive_path(season_store.season_for_date(date), dir)
+    if not os.path.exists(path):
+        return None
+    with zipfile.ZipFile(path) as zf:
+        try:
+            return zf.read(f"{date}.html")
+        except KeyError:
+            return None
+
+def archived_dates(season, dir='sbr'):
+    path = archive_path(season, dir)
+    if not os.path.exists(path):
+        return []
+    with zipfile.ZipFile(path) as zf:
+        return sorted(set(name[:-len(".html")] for name in zf.namelist() if name.endswith(".html")))
+
+
+def _reparse_chunk(season, dates, dir, parser):
+    # runs in a worker process. parse each page and write its csv.
+    import scrape_sbr
+    done = []
+    failed = {}
+    with zipfile.ZipFile(archive_path(season, dir)) as zf:
+        for date in dates:
+            try:
+                scraped = scrape_sbr.scrape_a_page(zf.read(f"{date}.html"), parser=parser)
+                scrape_sbr.write_csv_atomic(scraped, f"{dir}/{date}.csv")
+                done.append(date)
+            except Exception as e:
+                failed[date] = repr(e)
+    return (done, failed)
+
+def reparse_archive(season, dir='sbr', processes=None, parser='lxml', chunk_size=8):
+    """
+    Rebuild every daily csv for a season from the archived pages, spread over
+    `processes` worker processes (default: all cores). Then refreshes the season store.
+
+    Returns (dates written, {date: error} for pages that didn't parse).
+    """
+    # not at the top: scrape_sbr imports this module to save pages
+    import scrape_sbr
+    dates = archived_dates(season, dir)
+    chunks = [dates[i:i + chunk_size] for i in range(0, len(dates), chunk_size)]
+
+    done = []
+    failed = {}
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_reparse_chunk, season, chunk, dir, parser) for chunk in chunks]
+        for future in futures:
+            (chunk_done, chunk_failed) = future.result()
+            done.extend(chunk_done)
+            failed.update(chunk_failed)
+
+    for (date, error) in sorted(failed.items()):
+        print(f"choked on {date}: {error}")
+
+    season_store.update_season_store(season, dir=dir)
+    scrape_sbr.invalidate_clean_data_cache(dir)
+    return (sorted(done), failed)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="re-parse archived sportsbookreview pages")
+    sub = arg_parser.add_subparsers(dest='command', required=True)
+    reparse = sub.add_parser('reparse', help="rebuild the daily csv files for a season")
+    reparse.add_argument('season', type=int, help="first year of the season, eg 2024")
+    reparse.add_argument('--dir', default='sbr')
+    reparse.add_argument('--processes', type=int, default=None)
+    reparse.add_argument('--parser', default='lxml', choices=['bs4', 'lxml'])
+    args = arg_parser.parse_args()
+
+    (done, failed) = reparse_archive(args.season, dir=args.dir, processes=args.processes,
+                                     parser=args.parser)
+    print(f"wrote {len(done)} days, {len(failed)} failed")
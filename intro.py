@@ -1,5 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
+
+import experiments
 rng = np.random.default_rng(2718)
 np.random.seed(2718)
 
@@ -74,7 +76,85 @@ def do_some_bets(skill = .5, payout=1000, vig=1.1, throw_one_out=False,
         print(f"parlay: {parlay_profit_loss:,.2f}, straight: {straight_profit_loss:,.2f}, ratio: {ratio}")
     return (parlay_profit_loss, straight_profit_loss)
 
-def parlay_vs_straight(skill=.55, num_parlays=50):
+def simulate_parlays(runs=10000, skill=.5, payout=1000, vig=1.1, legs=4, throw_one_out=False,
+                     random_fourth_bet=False, same_total_risk=True, num_parlays=100000,
+                     max_draws=2**22, rng=rng):
+    """
+    Vectorized version of do_some_bets, for `runs` independent runs at once.
+
+    Every leg is drawn as part of a (runs, parlays, legs) array of wins/losses, in blocks of
+    at most `max_draws` random numbers, so memory stays bounded no matter how many
+    parlays you ask for. Only the win counts are kept.
+
+    The straight bets are the first legs-1 legs, plus the last leg (or a coin flip
+    if random_fourth_bet, or nothing if throw_one_out) -- same as do_some_bets.
+
+    Returns (parlay_profit_loss, straight_profit_loss), arrays with one entry per run.
+    """
+    if same_total_risk:
+        # the parlay risks 100, so split that across the straight bets.
+        one_straight_loss = 100 / legs
+        one_straight_win = one_straight_loss / vig
+    else:
+        one_straight_loss = 100
+        one_straight_win = 100 / vig
+
+    parlay_wins = np.zeros(runs, dtype=np.int64)
+    straight_wins = np.zeros(runs, dtype=np.int64)
+
+    # how many runs and parlays go in one block of random draws
+    parlays_per_block = max(1, max_draws // legs)
+    runs_per_block = max(1, parlays_per_block // num_parlays)
+    parlays_per_block = min(num_parlays, parlays_per_block)
+
+    for run_start in range(0, runs, runs_per_block):
+        run_end = min(runs, run_start + runs_per_block)
+        for parlay_start in range(0, num_parlays, parlays_per_block):
+            block = min(parlays_per_block, num_parlays - parlay_start)
+            bets = rng.random((run_end - run_start, block, legs)) < skill
+
+            parlay_wins[run_start:run_end] += bets.all(axis=2).sum(axis=1)
+            straight_wins[run_start:run_end] += bets[:, :, :-1].sum(axis=(1, 2))
+
+            if random_fourth_bet:
+                # what if the last bet is taken by flipping a coin?
+                coin_flips = rng.random((run_end - run_start, block)) < .5
+                straight_wins[run_start:run_end] += coin_flips.sum(axis=1)
+            elif not throw_one_out:
+                straight_wins[run_start:run_end] += bets[:, :, -1].sum(axis=1)
+
+    straight_bets = num_parlays * (legs - 1)
+    if random_fourth_bet or not throw_one_out:
+        straight_bets += num_parlays
+
+    parlay_profit_loss = (parlay_wins * payout) - ((num_parlays - parlay_wins) * 100)
+    straight_profit_loss = (straight_wins * one_straight_win) - ((straight_bets - straight_wins) * one_straight_loss)
+    return (parlay_profit_loss.astype(float), straight_profit_loss)
+
+def _parlay_block(runs, rng, **kwargs):
+    # one block of runs for experiments.run_trials
+    return simulate_parlays(runs=runs, rng=rng, **kwargs)
+
+def parlay_vs_straight(skill=.55, num_parlays=50, runs=10000, vectorized=False, workers=None, seed=2718):
+    """
+    vectorized=False (the default) is the original loop over do_some_bets, drawing from
+    the module's rng like it always has. vectorized=True uses simulate_parlays for all
+    the runs at once: much faster, same answer statistically, but a different random
+    stream, so the counts won't match the loop's.
+
+    The vectorized runs go through experiments.run_trials, so they only depend on `seed`,
+    not on how many workers there are (workers=k splits them over k processes). seed and
+    workers don't do anything for the loop.
+    """
+    if vectorized:
+        (parlay_results, straight_results) = experiments.run_trials(
+            _parlay_block, runs, seed=seed, workers=workers,
+            skill=skill, payout=1228.33, num_parlays=num_parlays)
+        print(f"parlay wins: {np.sum(parlay_results > straight_results)}, straight: {np.sum(straight_results > parlay_results)}")
+        print(f"parlay big losses: {np.sum(parlay_results < -1000)}, straight big losses: {np.sum(straight_results < -1000)}")
+        print(f"parlays made money: {np.sum(parlay_results > 0)}, straights: {np.sum(straight_results > 0)}")
+        return list(zip(parlay_results.tolist(), straight_results.tolist()))
+
     parlay_wins = 0
     straight_wins = 0
 
@@ -86,7 +166,7 @@ def parlay_vs_straight(skill=.55, num_parlays=50):
 
     all_results = []
 
-    for x in range(10000):
+    for x in range(runs):
         results = do_some_bets(skill=skill, payout=1228.33, 
                                num_parlays=num_parlays, silent=True)
         if results[0] > results[1]:
@@ -0,0 +1,303 @@
+import datetime
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import fader
+import scrape_sbr
+
+"""
+Keeps the season's ATS standings in memory so the morning picks don't have to
+rebuild them from opening night every time (which is what fader.daily_picks does).
+
+The standings get updated a day at a time with scrape_sbr.RollingStandings. Every
+refresh (and every request on a new day) fetches yesterday if it's not on disk
+yet and folds in any days that have landed since the last one. If a day that was
+missing shows up later (eg a csv copied in by hand), the standings get rebuilt from
+the start of the season, since RollingStandings can only add days on the end.
+Today's page is scraped live but not saved, and kept for `page_ttl` seconds since
+the lines move. Nothing that goes to the network holds the lock.
+
+    python picks_service.py serve --port 8111           # http server
+    python picks_service.py picks                       # just print today's picks
+
+Endpoints:
+    GET  /picks[?date=2025-01-15]   today's superfade picks, as json records. a date the
+                                    standings are already past gets standings rebuilt
+                                    through the day before it, so there's no look-ahead.
+                                    dates after today are a 400.
+    GET  /standings                 the ATS standings the picks are using (503 until
+                                    the first refresh has some)
+    GET  /health                    which day the standings go through
+    POST /refresh                   pick up new days now, instead of waiting
+
+base_url can point at a local stand-in for sportsbookreview for testing (it gets
+?date=YYYY-M-D like the real page), and every method takes `today` so a test can
+pretend it's any day of the season.
+"""
+
+def _day(date):
+    return pd.Timestamp(date).normalize()
+
+class BadDate(ValueError):
+    # a date we won't answer for (the http server sends a 400)
+    pass
+
+def _check_not_future(today):
+    if today > _day(datetime.datetime.now()):
+        raise BadDate(f"{today:%Y-%m-%d} hasn't happened yet")
+
+
+class PicksService:
+    def __init__(self, dir='sbr', start="2024-10-22", window=None, eliminate_top=5,
+                 lower_thresh=49, upper_thresh=60, base_url=scrape_sbr.SAMPLE_PAGE,
+                 fetch=True, page_ttl=300, retries=3):
+        self.dir = dir
+        self.start = _day(start)
+        self.window = window
+        self.eliminate_top = eliminate_top
+        self.lower_thresh = lower_thresh
+        self.upper_thresh = upper_thresh
+        self.base_url = base_url
+        # fetch=False never goes to the network for old days, only reads what's on disk
+        self.fetch = fetch
+        self.page_ttl = page_ttl
+        self.retries = retries
+
+        self.lock = threading.RLock()
+        self.session = scrape_sbr.make_session()
+        self.rolling = scrape_sbr.RollingStandings(window=window)
+        # last day we've looked at on disk, and the last day that actually had games
+        self.checked_through = None
+        # days before checked_through that had no data when we got to them
+        self.missing = set()
+        self.refreshed_for = None
+        self.standings_day = None
+        self.standings = None
+        # date -> (time fetched, scraped page)
+        self.pages = {}
+
+    def refresh(self, today=None):
+        """
+        Bring the standings up through yesterday. Only reads the days that are new
+        since the last refresh. Returns the day the standings go through.
+        """
+        today = _day(today if today is not None else datetime.datetime.now())
+        _check_not_future(today)
+        yesterday = today - pd.Timedelta(days=1)
+
+        with self.lock:
+            self.refreshed_for = today
+        # the fetch can take a while (retries, backoff), so /picks and /standings
+        # keep answering from the current standings in the meantime
+        if self.fetch:
+            scrape_sbr.fetch_data_range(yesterday, yesterday, dir=self.dir,
+                                        base_url=self.base_url, session=self.session)
+
+        with self.lock:
+            if any(os.path.exists(f"{self.dir}/{day}.csv") for day in self.missing):
+                # a day we skipped has turned up. start over so it's in the right place.
+                self.rolling = scrape_sbr.RollingStandings(window=self.window)
+                self.checked_through = None
+                self.missing = set()
+
+            if self.checked_through is None:
+                first = self.start
+            else:
+                first = self.checked_through + pd.Timedelta(days=1)
+            if first > yesterday:
+                return self.standings_day
+
+            daily_frames = scrape_sbr.clean_data_by_day(start=first, end=yesterday, dir=self.dir)
+            last_with_data = None
+            skipped = []
+            for day in pd.date_range(first, yesterday).strftime("%Y-%m-%d"):
+                if day not in daily_frames:
+                    skipped.append(day)
+                    continue
+                self.rolling.add_day(daily_frames[day])
+                last_with_data = day
+
+            if last_with_data is not None:
+                self.standings_day = last_with_data
+                self.standings = self.rolling.standings()
+                self.checked_through = _day(last_with_data)
+                self.missing.update(day for day in skipped if day < last_with_data)
+            # days after the last one with data get looked at again next time,
+            # in case they were missing because the scrape failed.
+            return self.standings_day
+
+    def standings_through(self, last):
+        """
+        (last day with data, standings) as of `last`, built from scratch off what's on
+        disk. For dates before the ones the running standings already include.
+        """
+        rolling = scrape_sbr.RollingStandings(window=self.window)
+        daily_frames = scrape_sbr.clean_data_by_day(start=self.start, end=last, dir=self.dir)
+        last_with_data = None
+        for day in sorted(daily_frames):
+            rolling.add_day(daily_frames[day])
+            last_with_data = day
+        if last_with_data is None:
+            return (None, None)
+        return (last_with_data, rolling.standings())
+
+    def today_page(self, today):
+        date = today.strftime("%Y-%m-%d")
+        with self.lock:
+            if date in self.pages and time.monotonic() - self.pages[date][0] < self.page_ttl:
+                return self.pages[date][1]
+
+        # fetch outside the lock so a slow page doesn't hold up /standings
+        today_data = scrape_sbr.get_for_date(today.year, today.month, today.day, dir=self.dir,
+                                             save_csv=False, session=self.session,
+                                             retries=self.retries, base_url=self.base_url)
+        today_data['game_date'] = date
+        with self.lock:
+            self.pages = {date: (time.monotonic(), today_data)}
+        return today_data
+
+    def picks(self, today=None):
+        """
+        Same as fader.daily_picks: superfade on today's games, using the standings
+        through the last day with results.
+        """
+        today = _day(today if today is not None else datetime.datetime.now())
+        _check_not_future(today)
+        with self.lock:
+            past = self.standings_day is not None and today <= _day(self.standings_day)
+        if past:
+            # the running standings already have today's results (or later) in them
+            (standings_day, standings) = self.standings_through(today - pd.Timedelta(days=1))
+        else:
+            # first request on a new day picks up yesterday. (if it's not there yet, the
+            # background refresher keeps trying.)
+            if self.refreshed_for != today:
+                self.refresh(today)
+            with self.lock:
+                (standings_day, standings) = (self.standings_day, self.standings)
+        if standings is None:
+            raise ValueError(f"no results on disk between {self.start:%Y-%m-%d} and {today:%Y-%m-%d}")
+
+        today_data = self.today_page(today).copy()
+        # superfade lags the standings by a day, so today gets the latest ones
+        ats_record = {standings_day: standings, today.strftime("%Y-%m-%d"): standings}
+        return fader.superfade(eliminate_top=self.eliminate_top, lower_thresh=self.lower_thresh,
+                               upper_thresh=self.upper_thresh, base_picks=today_data,
+                               ats_record=ats_record)
+
+    def current_standings(self):
+        # (day, standings) as of the last refresh, or (None, None) before there are any
+        with self.lock:
+            return (self.standings_day, self.standings)
+
+    def run_refresher(self, every=600):
+        # keep checking for yesterday's results in the background
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(every):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"refresh failed: {e!r}")
+
+        threading.Thread(target=loop, daemon=True).start()
+        return stop
+
+
+def make_handler(service):
+    class PicksHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, action):
+            try:
+                self._send(200, action())
+            except BadDate as e:
+                self._send(400, json.dumps({'error': str(e)}))
+            except Exception as e:
+                self._send(500, json.dumps({'error': repr(e)}))
+
+        def _standings(self):
+            (standings_day, standings) = service.current_standings()
+            if standings is None:
+                self._send(503, json.dumps({'error': "no standings yet"}))
+            else:
+                self._send(200, standings.to_json(orient='index'))
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            if url.path == '/picks':
+                today = query.get('date', [None])[0]
+                if today is not None:
+                    try:
+                        _day(today)
+                    except ValueError:
+                        self._send(400, json.dumps({'error': f"can't read date {today}"}))
+                        return
+                self._handle(lambda: service.picks(today).to_json(orient='records'))
+            elif url.path == '/standings':
+                self._standings()
+            elif url.path == '/health':
+                self._handle(lambda: json.dumps({'standings_through': service.standings_day}))
+            else:
+                self._send(404, json.dumps({'error': f"no such page {url.path}"}))
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == '/refresh':
+                self._handle(lambda: json.dumps({'standings_through': service.refresh()}))
+            else:
+                self._send(404, json.dumps({'error': f"no such page {url.path}"}))
+
+        def log_message(self, format, *args):
+            pass
+
+    return PicksHandler
+
+def serve(service, host='127.0.0.1', port=8111, refresh_every=600):
+    """
+    Warm up the standings, then answer requests until killed.
+    Returns the server (serve_forever is up to the caller).
+    """
+    service.refresh()
+    service.run_refresher(refresh_every)
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="today's fade picks, with the standings kept warm")
+    arg_parser.add_argument('command', choices=['serve', 'picks'])
+    arg_parser.add_argument('--dir', default='sbr')
+    arg_parser.add_argument('--start', default="2024-10-22", help="first day of the season")
+    arg_parser.add_argument('--window', type=int, default=None)
+    arg_parser.add_argument('--eliminate-top', type=float, default=5)
+    arg_parser.add_argument('--base-url', default=scrape_sbr.SAMPLE_PAGE)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8111)
+    arg_parser.add_argument('--refresh-every', type=int, default=600, help="seconds")
+    args = arg_parser.parse_args()
+
+    eliminate_top = args.eliminate_top if args.eliminate_top < 1 else int(args.eliminate_top)
+    service = PicksService(dir=args.dir, start=args.start, window=args.window,
+                           eliminate_top=eliminate_top, base_url=args.base_url)
+    if args.command == 'picks':
+        print(service.picks())
+    else:
+        server = serve(service, host=args.host, port=args.port, refresh_every=args.refresh_every)
+        print(f"serving picks on http://{args.host}:{args.port}/picks")
+        server.serve_forever()
@@ -2,17 +2,114 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import experiments
+
 class RandomWalk:
     def __init__(self):
         self.rng = np.random.default_rng(2718)
         self.VIG = -1.1
 
     def gen_random_walk(self, p, n):
-        win_or_lose = (np.random.rand(n) < p).astype("float")
+        win_or_lose = (self.rng.random(n) < p).astype("float")
         win_or_lose[win_or_lose==0] = self.VIG
         random_walk = np.cumsum(win_or_lose)
         return random_walk
 
+    ### batch versions. these build lots of walks at once as a 2-D array, from self.rng.
+    ### internally the array is (steps, walks), in integer units when the vig allows it
+    ### (-1.1 -> -11 tenths), which is a lot faster than floats.
+
+    def _scale(self):
+        for scale in [1, 10, 100, 1000]:
+            if np.isclose(self.VIG * scale, np.round(self.VIG * scale)):
+                return scale
+        return None
+
+    def _regime_skills(self, skill_levels, walks, periods, determinate, rng=None):
+        # (periods, walks) skill level for each period of each walk. same rules as
+        # generate_alternating: determinate always flips, starting from the other level
+        # than skill_levels[0]. otherwise it's a coin flip every period.
+        if rng is None:
+            rng = self.rng
+        levels = np.asarray(skill_levels, dtype=np.float32)
+        if determinate:
+            flips = np.arange(1, periods + 1) % len(levels)
+            return np.repeat(levels[flips][:, None], walks, axis=1)
+        return levels[rng.integers(0, len(levels), size=(periods, walks))]
+
+    def _walk_block(self, skills, period_length, rng=None):
+        """
+        Random walks for a (periods, walks) array of skill levels. Returns (walks, scale):
+        walks is (steps, walks) in units of 1/scale.
+        """
+        if rng is None:
+            rng = self.rng
+        (periods, walks) = skills.shape
+        n = periods * period_length
+        draws = rng.random((periods, period_length, walks), dtype=np.float32)
+        wins = (draws < skills[:, None, :]).reshape(n, walks)
+
+        scale = self._scale()
+        if scale is None:
+            steps = np.where(wins, 1.0, self.VIG)
+            return (np.cumsum(steps, axis=0, out=steps), 1)
+
+        lose_step = int(np.round(self.VIG * scale))
+        steps = wins.astype(np.int32)
+        steps *= (scale - lose_step)
+        steps += lose_step
+        return (np.cumsum(steps, axis=0, out=steps), scale)
+
+    def gen_random_walks(self, p, n, walks=1000):
+        """
+        `walks` random walks of n bets at win probability p, as a (walks, n) array.
+        (gen_random_walk, but lots at once)
+        """
+        skills = np.full((1, walks), p, dtype=np.float32)
+        (block, scale) = self._walk_block(skills, n)
+        return block.T / scale
+
+    def gen_regime_walks(self, skill_levels, walks=1000, determinate=False, period_length=100, periods=10):
+        """
+        Batch version of generate_alternating. The skill level can change every
+        period_length bets. Returns (walks, skills): walks is (walks, steps), skills
+        is the (walks, periods) skill level each walk had in each period.
+        """
+        skills = self._regime_skills(skill_levels, walks, periods, determinate)
+        (block, scale) = self._walk_block(skills, period_length)
+        return (block.T / scale, skills.T)
+
+    def walk_summaries(self, p=None, n=1000, walks=10000, ruin=None, skill_levels=None,
+                       determinate=False, period_length=100, periods=10, max_steps=2**24,
+                       workers=None, seed=2718):
+        """
+        Summary stats for lots of walks, without keeping the walks around. Pass either a 
+        win probability p (with n bets), or skill_levels for regime switching (like 
+        gen_regime_walks). The walks get generated max_steps bets at a time.
+
+        The blocks go through experiments.run_trials, so the results only depend on `seed`
+        (workers=k spreads them over k processes).
+
+        Returns a DataFrame with one row per walk. See summarize_walks for the columns.
+        """
+        if skill_levels is None:
+            period_length = n
+            periods = 1
+        walks_per_block = max(1, max_steps // (period_length * periods))
+        settings = dict(p=p, ruin=ruin, skill_levels=skill_levels, determinate=determinate,
+                        period_length=period_length, periods=periods)
+
+        return experiments.run_trials(_summary_block, walks, block_size=walks_per_block, 
+                                      seed=seed, workers=workers, walker=self, **settings)
+
+    def _summary_block(self, walks, rng, p, ruin, skill_levels, determinate, period_length, periods):
+        if skill_levels is None:
+            skills = np.full((1, walks), p, dtype=np.float32)
+        else:
+            skills = self._regime_skills(skill_levels, walks, periods, determinate, rng=rng)
+        (block, scale) = self._walk_block(skills, period_length, rng=rng)
+        return _summarize(block, scale, ruin)
+
     def plot_random_walk(self, p, n=1000):
         fig, axs = plt.subplots(3,3, sharey='all')
         plt.suptitle(f"random walk with p={np.round(p, 3)}")
@@ -40,7 +137,7 @@ class RandomWalk:
                 current_skill = skill_copy[0]
             else:
                 # randomly flip between good and bad (so it can stay the same for multiple periods)
-                current_skill = np.random.choice(skill_levels)
+                current_skill = self.rng.choice(skill_levels)
 
             # mark every time we switch skill_levels
             if current_skill != prev_skill:
@@ -49,7 +146,7 @@ class RandomWalk:
                 elif current_skill < prev_skill:
                     ticks_down.append(x * period_length)
             # if the random value is less than the skill level, it's a win, otherwise it's a loss
-            win_or_lose = (np.random.rand(period_length) < current_skill).astype("float")
+            win_or_lose = (self.rng.random(period_length) < current_skill).astype("float")
             
             # step back by VIG amount on losses
             win_or_lose[win_or_lose==0] = self.VIG
@@ -92,4 +189,36 @@ class RandomWalk:
                                         alpha=0.5)
                 walk_counter += 1
         #plt.figure(figsize=(12,12)) # FIXME: this isn't working to make the image bigger.
-    
\ No newline at end of file
+    
+
+def _summary_block(walks, rng, walker, **settings):
+    # one block of walks for experiments.run_trials
+    return walker._summary_block(walks, rng, **settings)
+
+def summarize_walks(walks, ruin=None):
+    """
+    Summary stats for a (walks, steps) array of random walks (eg from gen_random_walks):
+
+    final: P&L at the end
+    max_drawdown: biggest drop from a high-water mark (which starts at 0)
+    time_under_water: number of bets spent below the high-water mark
+    ruin_step: first bet where the walk is down `ruin` units or more, -1 if never. 
+               (only if ruin is passed)
+    """
+    return _summarize(np.asarray(walks).T, 1, ruin)
+
+def _summarize(block, scale, ruin=None):
+    # block is (steps, walks) in units of 1/scale
+    summary = pd.DataFrame({'final': block[-1] / scale})
+
+    peak = np.maximum(block, 0)
+    np.maximum.accumulate(peak, axis=0, out=peak)
+    peak -= block
+    summary['max_drawdown'] = peak.max(axis=0) / scale
+    summary['time_under_water'] = np.count_nonzero(peak, axis=0)
+    del peak
+
+    if ruin is not None:
+        ruined = block <= -(ruin * scale)
+        summary['ruin_step'] = np.where(ruined.any(axis=0), ruined.argmax(axis=0), -1)
+    return summary
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+import experiments
+
+"""
+Significance tests for fade strategies that respect the dates the picks were made on.
+
+win_loss_report's z test treats every pick as an independent coin flip. But picks
+on the same night aren't independent draws from the season, so permutation_test
+builds the null distribution of a strategy's units by scrambling results within
+each date instead:
+
+    'shuffle' -- give each pick the result (AWAY/HOME/push) of a random game from the
+                 same date, keeping the sides we picked. Same as shuffling winner_ats
+                 within dates, but the counts get drawn directly (hypergeometric), so
+                 it never builds a permutations x picks matrix.
+    'flip'    -- flip every pick on a date to the other side, for a random half of
+                 the dates. One matrix product per block of permutations.
+
+Both run through experiments.run_trials, so they can be spread over processes
+and the answer only depends on the seed.
+
+bootstrap_fade puts confidence intervals on the overall units and on every column of
+fader.analyze_fade, by resampling games (or whole dates) with replacement.
+"""
+
+def date_counts(picks):
+    """
+    Everything the tests need from a frame of picks (eg superfade output), one row per date:
+    picks made, picks on the away team, and how many of those games the away/home team
+    covered or pushed.
+    """
+    picks = picks[picks.fade.notna()]
+    fade_away = (picks.fade.astype(object) == "AWAY").to_numpy()
+    result = picks.winner_ats.astype(object)
+    away_won = (result == "AWAY").to_numpy()
+    home_won = (result == "HOME").to_numpy()
+    won = (picks.fade.astype(object) == result).to_numpy()
+
+    counts = pd.DataFrame({'game_date': picks.game_date.astype(object).to_numpy(),
+                           'picks': 1,
+                           'fade_away': fade_away.astype(np.int64),
+                           'away_won': away_won.astype(np.int64),
+                           'home_won': home_won.astype(np.int64),
+                           'wins': won.astype(np.int64),
+                           'losses': ((away_won | home_won) & ~won).astype(np.int64)})
+    counts = counts.groupby('game_date', sort=True).sum()
+    counts['pushes'] = counts.picks - counts.away_won - counts.home_won
+    return counts
+
+def _shuffle_block(n, rng, counts, vig):
+    # how many AWAY / HOME results land on the picks that took the away team, for each date
+    away_on_away = rng.hypergeometric(counts['away_won'], counts['home_won'] + counts['pushes'],
+                                      counts['fade_away'], size=(n, len(counts['picks'])))
+    home_on_away = rng.hypergeometric(counts['home_won'], counts['pushes'],
+                                      counts['fade_away'] - away_on_away)
+    # the rest of the results go to the picks that took the home team
+    wins = away_on_away + (counts['home_won'] - home_on_away)
+    losses = home_on_away + (counts['away_won'] - away_on_away)
+    return wins.sum(axis=1) - (vig * losses.sum(axis=1))
+
+def _flip_block(n, rng, counts, vig):
+    units = counts['wins'] - (vig * counts['losses'])
+    flipped = counts['losses'] - (vig * counts['wins'])
+    flips = (rng.random((n, len(units))) < .5).astype(np.float64)
+    return units.sum() + (flips @ (flipped - units))
+
+BLOCKS = {'shuffle': _shuffle_block, 'flip': _flip_block}
+
+def permutation_test(picks, n_perm=100000, method='shuffle', vig=1.1, seed=2718, block_size=10000,
+                     workers=None, return_null=False):
+    """
+    Empirical p-value for the units a set of picks made, against `n_perm` scrambled
+    versions of the same picks (see the top of this file for the methods).
+
+    p_value is the chance of doing at least this well under the null, counting the
+    real result as one of the permutations so it's never 0.
+    """
+    if method not in BLOCKS:
+        raise ValueError(f"unknown method {method}, try {list(BLOCKS)}")
+    counts = date_counts(picks)
+    arrays = {col: counts[col].to_numpy() for col in counts.columns}
+
+    wins = int(arrays['wins'].sum())
+    losses = int(arrays['losses'].sum())
+    units = wins - (vig * losses)
+
+    null = experiments.run_trials(BLOCKS[method], n_perm, block_size=block_size, seed=seed,
+                                  workers=workers, counts=arrays, vig=vig)
+    # a little slack so the real result counts as a tie with itself despite rounding
+    at_least = np.sum(null >= units - 1e-9)
+
+    result = {'wins': wins,
+              'losses': losses,
+              'units': units,
+              'null_mean': float(null.mean()),
+              'null_std': float(null.std()),
+              'p_value': float((1 + at_least) / (1 + n_perm)),
+              'n_perm': n_perm,
+              'method': method}
+    if return_null:
+        return (result, null)
+    return result
+
+
+## analyze_fade's per-team columns, as (column, picked the team?, won?)
+TEAM_COUNTS = [('win', True, True), ('lose', True, False),
+               ('wins_against', False, True), ('losses_against', False, False)]
+
+def _team_tables(picks, by_date):
+    # one row per game (or date), the per-team counts for analyze_fade side by side,
+    # then wins/losses/pushes for the overall record.
+    fade = picks.fade.astype(object).to_numpy()
+    result = picks.winner_ats.astype(object).to_numpy()
+    won = fade == result
+    graded = pd.notna(result)
+
+    (codes, teams) = pd.factorize(np.concatenate([picks.fade_pick.astype(object).to_numpy(),
+                                                  picks.fade_vs.astype(object).to_numpy()]))
+    n = len(picks)
+    (pick_codes, vs_codes) = (codes[:n], codes[n:])
+    if by_date:
+        (rows, dates) = pd.factorize(picks.game_date.astype(object).to_numpy(), sort=True)
+        n_rows = len(dates)
+    else:
+        rows = np.arange(n)
+        n_rows = n
+
+    n_teams = len(teams)
+    tables = []
+    for (col, picked, wanted) in TEAM_COUNTS:
+        team_codes = pick_codes if picked else vs_codes
+        # like analyze_fade, anything that isn't a win (pushes too) is a loss here
+        hit = won if wanted else ~won
+        tables.append(np.bincount(rows * n_teams + team_codes, weights=hit,
+                                  minlength=n_rows * n_teams).reshape(n_rows, n_teams))
+    overall = np.column_stack([np.bincount(rows, weights=won & graded, minlength=n_rows),
+                               np.bincount(rows, weights=~won & graded, minlength=n_rows)])
+    return (np.hstack(tables + [overall]), np.asarray(teams, dtype=object))
+
+def _bootstrap_block(n, rng, table):
+    # resample rows with replacement: how many times each row got drawn, for each resample,
+    # counted with one bincount over the whole (n x rows) index matrix
+    n_rows = len(table)
+    draws = rng.integers(0, n_rows, (n, n_rows))
+    times_drawn = np.bincount((np.arange(n)[:, None] * n_rows + draws).ravel(),
+                              minlength=n * n_rows).reshape(n, n_rows)
+    return times_drawn.astype(np.float64) @ table
+
+def bootstrap_fade(picks, n_boot=10000, by_date=False, ci=.95, vig=1.1, seed=2718, block_size=1000,
+                   workers=None):
+    """
+    Bootstrap confidence intervals for a set of picks (eg superfade output).
+
+    by_date=False resamples games, by_date=True resamples whole dates (block bootstrap),
+    which keeps games from the same night together.
+
+    Returns (per-team table, overall). The table is fader.analyze_fade's columns plus
+    {column}_lo and {column}_hi for each one. overall is a Series with the units and
+    win pct (pushes don't count, like win_loss_report) and their intervals.
+    """
+    picks = picks[picks.fade.notna()]
+    (table, teams) = _team_tables(picks, by_date)
+    n_teams = len(teams)
+
+    counts = experiments.run_trials(_bootstrap_block, n_boot, block_size=block_size, seed=seed,
+                                    workers=workers, table=table)
+    # the real data too, as if every row got drawn once
+    counts = np.vstack([table.sum(axis=0), counts])
+
+    cols = {}
+    for (i, (col, picked, wanted)) in enumerate(TEAM_COUNTS):
+        cols[col] = counts[:, i * n_teams:(i + 1) * n_teams]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cols['win_pct'] = cols['win'] / (cols['win'] + cols['lose'])
+    cols['units'] = cols['win'] - (vig * cols['lose'])
+    cols['win_units_against'] = cols['wins_against'] - (vig * cols['losses_against'])
+    cols['total_units'] = cols['units'] + cols['win_units_against']
+
+    (wins, losses) = (counts[:, -2], counts[:, -1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overall_cols = {'units': wins - (vig * losses), 'win_pct': wins / (wins + losses)}
+
+    tails = [(1 - ci) / 2, 1 - ((1 - ci) / 2)]
+    team_table = pd.DataFrame(index=pd.Index(teams, dtype=object))
+    for (col, values) in cols.items():
+        team_table[col] = values[0]
+        (team_table[f"{col}_lo"], team_table[f"{col}_hi"]) = np.nanquantile(values[1:], tails, axis=0)
+    for col in ['win', 'lose', 'wins_against', 'losses_against']:
+        team_table[col] = team_table[col].astype(int)
+
+    overall = {}
+    for (col, values) in overall_cols.items():
+        overall[col] = values[0]
+        (overall[f"{col}_lo"], overall[f"{col}_hi"]) = np.nanquantile(values[1:], tails)
+    return (team_table, pd.Series(overall))
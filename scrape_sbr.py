@@ -1,11 +1,25 @@
 import re
 import requests
+import numpy as np
 import pandas as pd
 import datetime
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, OrderedDict, deque
 import bs4 as bs # beautifulsoup
 
+try:
+    # optional, only needed for scrape_a_page(parser='lxml')
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+import season_store
+import html_archive
+
 """
 This code scrapes NBA betting information from sportsbookreview.com
 
@@ -18,52 +32,278 @@ SAMPLE_PAGE = "https://www.sportsbookreview.com/betting-odds/nba-basketball/"
 ##  best odds of winning the title at the beginning of the year.
 TOP_TEAMS_FUTURES = ["Boston", "Oklahoma City", "Denver", "Minnesota", "New York"]
 
+## team names as they show up on sportsbookreview. the position in this list is the team id
+## used by the categorical columns (see to_categorical). 
+NBA_TEAMS = ["Atlanta", "Boston", "Brooklyn", "Charlotte", "Chicago", "Cleveland", "Dallas", 
+             "Denver", "Detroit", "Golden State", "Houston", "Indiana", "L.A. Clippers", 
+             "L.A. Lakers", "Memphis", "Miami", "Milwaukee", "Minnesota", "New Orleans", 
+             "New York", "Oklahoma City", "Orlando", "Philadelphia", "Phoenix", "Portland", 
+             "Sacramento", "San Antonio", "Toronto", "Utah", "Washington"]
+
+## which columns get which categories in to_categorical.
+TEAM_COLUMNS = ['away_names', 'home_names', 'winner_ats_name', 'loser_ats_name', 
+                'money_winner', 'money_loser', 'fade_pick', 'fade_vs']
+SIDE_COLUMNS = ['winner_ats', 'open_winner_ats', 'fade']
+FAVE_DOG_COLUMNS = ['fave_dog', 'open_fave_dog']
+## strings that repeat a lot but don't have a fixed set of values
+REPEATED_COLUMNS = ['away_lines', 'home_lines', 'away_opens', 'home_opens']
+SMALL_INT_COLUMNS = ['away_scores', 'home_scores', 'away_percents', 'home_percents']
+
+SIDE_DTYPE = pd.CategoricalDtype(['AWAY', 'HOME'])
+FAVE_DOG_DTYPE = pd.CategoricalDtype(['DOG', 'FAVE'])
+
+def team_dtype(names=()):
+    """
+    Categorical dtype for team names. Always NBA_TEAMS first (so the codes are the same
+    everywhere), plus any other names in `names` we didn't know about.
+    """
+    known = set(NBA_TEAMS)
+    extra = sorted(set(n for n in names if isinstance(n, str) and n not in known))
+    return pd.CategoricalDtype(NBA_TEAMS + extra)
+
+def to_categorical(df):
+    """
+    Convert the team name / outcome label columns to categoricals, and scores and
+    percents to small ints. Works on raw, cleaned, or fade_the_public frames. 
+    A lot smaller, and value_counts/groupby/isin get faster.
+    """
+    team_cols = [c for c in TEAM_COLUMNS if c in df.columns]
+    names = set()
+    for col in team_cols:
+        names.update(df[col].dropna().unique())
+    teams = team_dtype(names)
+
+    for col in team_cols:
+        df[col] = df[col].astype(teams)
+    for col in SIDE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(SIDE_DTYPE)
+    for col in FAVE_DOG_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(FAVE_DOG_DTYPE)
+    for col in REPEATED_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in SMALL_INT_COLUMNS:
+        if col in df.columns and df[col].dtype.kind in "iu":
+            df[col] = df[col].astype(np.int16)
+    return df
+
+def observed_value_counts(values):
+    # value_counts, minus the zero counts a categorical column adds for unused categories.
+    counts = values.value_counts()
+    return counts[counts > 0]
+
 def money_vs_ats(start=START_DATE, end=END_DATE, dir='sbr'):
     data = clean_data(start=start, end=end, dir=dir)
     return money_vs_ats_from_data(data)
 
 def money_vs_ats_from_data(data):
     combo_percents = get_money(data)
-    ats_winners = data.winner_ats_name.value_counts()
-    ats_losers = data.loser_ats_name.value_counts()
+    ats_winners = observed_value_counts(data.winner_ats_name)
+    ats_losers = observed_value_counts(data.loser_ats_name)
+
+    ## how many games has each team gotten the majority of the money?
+    money_game_winners = observed_value_counts(data.money_winner)
 
+    return standings_frame(ats_winners, ats_losers, combo_percents, money_game_winners)
+
+def standings_frame(ats_winners, ats_losers, combo_percents, money_game_winners):
+    # shared by money_vs_ats_from_data and RollingStandings so they build the exact same frame.
     df = pd.DataFrame({'winner': ats_winners, 'loser': ats_losers})
     df = df.fillna(0)
     df['ats_win_pct'] = df.winner / (df.winner + df.loser)
     df['money_percents'] = combo_percents
-
-    ## how many games has each team gotten the majority of the money?
-    df['money_game_winners'] = data.money_winner.value_counts()
+    df['money_game_winners'] = money_game_winners
 
     return df
 
+class RunningMedians:
+    """
+    Running median money percent for each team.
+
+    The percents are whole numbers from 0 to 100, so each team just keeps a count of
+    how many times it's had each value (one row of a teams x 101 array). Adding or
+    taking away a game is one increment, and the medians come from the cumulative counts.
+    Gives the same numbers as groupby(...).median() on the same games. `name` is the
+    name of the team index, like the groupby column would give it.
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self.rows = {}
+        self.counts = np.zeros((0, 101), dtype=np.int64)
+
+    def update(self, team_percents, sign=1):
+        for (team, pct) in team_percents:
+            if pd.isna(pct):
+                continue
+            if pct != int(pct) or not 0 <= pct <= 100:
+                raise ValueError(f"money percent for {team} should be a whole number 0-100, got {pct}")
+            if team not in self.rows:
+                self.rows[team] = len(self.rows)
+                if len(self.rows) > len(self.counts):
+                    self.counts = np.vstack([self.counts, np.zeros((len(self.counts) + 1, 101), dtype=np.int64)])
+            self.counts[self.rows[team], int(pct)] += sign
+
+    def medians(self):
+        teams = sorted(team for (team, row) in self.rows.items() if self.counts[row].sum() > 0)
+        if len(teams) == 0:
+            return pd.Series([], index=pd.Index([], dtype=object, name=self.name), dtype='float64')
+        counts = self.counts[[self.rows[team] for team in teams]]
+        n = counts.sum(axis=1)
+        below = counts.cumsum(axis=1)
+        # the ((n-1)//2)th and (n//2)th smallest values, averaged (they're the same one when n is odd)
+        low = (below > ((n - 1) // 2)[:, None]).argmax(axis=1)
+        high = (below > (n // 2)[:, None]).argmax(axis=1)
+        return pd.Series((low + high) / 2, index=pd.Index(teams, dtype=object, name=self.name), dtype='float64')
+
+
+class RollingStandings:
+    """
+    Running ATS standings, updated one day at a time.
+
+    Keeps per-team winner/loser/money_winner counts plus running medians of the
+    home/away money percents, so each day is (add today's games) - (the day that fell out of the window)
+    instead of concatenating the whole season again. standings() gives the same frame
+    as money_vs_ats_from_data on the concatenated days.
+    """
+    def __init__(self, window=None):
+        # window is the number of days *with data* to keep, like get_ats_for_range. None = everything
+        self.window = window
+        self.deltas = deque()
+
+        self.winners = Counter()
+        self.losers = Counter()
+        self.money_winners = Counter()
+        self.home_percents = RunningMedians()
+        self.away_percents = RunningMedians()
+
+    @staticmethod
+    def day_delta(daily_data):
+        # everything we need from one day of clean_data, as plain python lists.
+        return {
+            'winners': daily_data.winner_ats_name.dropna().tolist(),
+            'losers': daily_data.loser_ats_name.dropna().tolist(),
+            'money_winners': daily_data.money_winner.dropna().tolist(),
+            'home': list(zip(daily_data.home_names.tolist(), daily_data.home_percents.tolist())),
+            'away': list(zip(daily_data.away_names.tolist(), daily_data.away_percents.tolist())),
+        }
+
+    def add_day(self, daily_data):
+        delta = self.day_delta(daily_data)
+        self._apply(delta, 1)
+        self.deltas.append(delta)
+
+        if self.window is not None:
+            while len(self.deltas) > self.window:
+                self._apply(self.deltas.popleft(), -1)
+
+    def _apply(self, delta, sign):
+        for (counter, key) in [(self.winners, 'winners'),
+                               (self.losers, 'losers'),
+                               (self.money_winners, 'money_winners')]:
+            counter.update({team: sign * n for (team, n) in Counter(delta[key]).items()})
+
+        self.home_percents.update(delta['home'], sign)
+        self.away_percents.update(delta['away'], sign)
+
+    @staticmethod
+    def _counts(counter):
+        teams = sorted(team for (team, n) in counter.items() if n > 0)
+        return pd.Series([counter[team] for team in teams], 
+                         index=pd.Index(teams, dtype=object), dtype='int64')
+
+    def money(self):
+        # same as get_money on the days in the window.
+        return self.home_percents.medians().add(self.away_percents.medians(), fill_value=50)
+
+    def standings(self):
+        return standings_frame(self._counts(self.winners), self._counts(self.losers),
+                               self.money(), self._counts(self.money_winners))
+
+class RankMatrix:
+    """
+    One number per team per day (teams x days numpy arrays), eg ats_win_pct from
+    get_ats_for_range or the money percents from get_money_for_range, ranked within
+    each day all at once.
+
+    rank_desc[i, j] is where team i stands on day j counting from the highest value
+    (0 = best), rank_asc from the lowest. Teams with no value that day are NaN and are
+    never in the top or bottom. Ties go to the team that comes first alphabetically.
+    """
+    def __init__(self, by_date, column=None):
+        self.days = list(by_date.keys())
+        self.day_index = {day: j for (j, day) in enumerate(self.days)}
+        self.teams = np.array(sorted(set().union(*[frame.index.astype(object) for frame in by_date.values()])),
+                              dtype=object)
+
+        self.values = np.full((len(self.teams), len(self.days)), np.nan)
+        for (j, frame) in enumerate(by_date.values()):
+            values = frame if column is None else frame[column]
+            values = pd.Series(values.to_numpy(dtype=float), index=frame.index.astype(object))
+            self.values[:, j] = values.reindex(self.teams).to_numpy()
+
+        self.valid = ~np.isnan(self.values)
+        # argsort puts NaN last either way, and stable keeps the alphabetical order on ties
+        self.rank_desc = self._ranks(-self.values)
+        self.rank_asc = self._ranks(self.values)
+
+    @staticmethod
+    def _ranks(values):
+        order = np.argsort(values, axis=0, kind='stable')
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(len(values))[:, None], axis=0)
+        return ranks
+
+    def top_mask(self, n):
+        # teams x days, True for the n highest each day
+        return self.valid & (self.rank_desc < n)
+
+    def bottom_mask(self, n):
+        return self.valid & (self.rank_asc < n)
+
+    def above_mask(self, value):
+        return self.valid & (self.values > value)
+
+    def below_mask(self, value):
+        return self.valid & (self.values < value)
+
+    def top(self, day, n):
+        # the n highest teams on one day, best first
+        j = self.day_index[day]
+        ranks = self.rank_desc[:, j]
+        teams = np.flatnonzero(self.valid[:, j] & (ranks < n))
+        return self.teams[teams[np.argsort(ranks[teams])]]
+
+    def bottom(self, day, n):
+        j = self.day_index[day]
+        ranks = self.rank_asc[:, j]
+        teams = np.flatnonzero(self.valid[:, j] & (ranks < n))
+        return self.teams[teams[np.argsort(ranks[teams])]]
+
+
 def get_ats_for_range(start=START_DATE, end=END_DATE, dir='sbr', window=None):
     # get record ATS for every day in range.
     output = {}
-    raw_dfs = {}
+    standings = RollingStandings(window=window)
+    daily_frames = clean_data_by_day(start=start, end=end, dir=dir)
+
     range = pd.date_range(start, end).strftime("%Y-%m-%d")
     for day in range:
-        daily_data = clean_data(start=day, end=day, dir=dir)
+        daily_data = daily_frames.get(day)
         if daily_data is None:
             print(f"Skipping {day}, no data")
             continue
-        raw_dfs[day] = daily_data
-        # create a dataframe of everything in raw_dfs.values()
-        if window is not None:
-            data_in_range = list(raw_dfs.values())[-window:]
-        else:
-            data_in_range = raw_dfs.values()
-        season_to_date = pd.concat(data_in_range)
-
-        output[day] = money_vs_ats_from_data(season_to_date)
+        standings.add_day(daily_data)
+        output[day] = standings.standings()
 
     return output
 
 
 def get_money(df):
     ### get money percentages (combined home+away)
-    home_percents = df.groupby('home_names').median('home_percents')['home_percents']
-    away_percents = df.groupby('away_names').median('away_percents')['away_percents']
+    home_percents = df.groupby('home_names', observed=True).median('home_percents')['home_percents']
+    away_percents = df.groupby('away_names', observed=True).median('away_percents')['away_percents']
     combined_percents = home_percents.add(away_percents, fill_value=50)
     return combined_percents
 
@@ -76,46 +316,52 @@ def get_money_for_range(start=START_DATE, end=END_DATE, dir='sbr', verbose=False
     For use with the 'superfade' 
     
     """
-    raw_dfs = {}
     output = {}
+    home_percents = RunningMedians('home_names')
+    away_percents = RunningMedians('away_names')
+    daily_frames = clean_data_by_day(start=start, end=end, dir=dir)
+
     range = pd.date_range(start, end).strftime("%Y-%m-%d")
     for day in range:
-        daily_data = clean_data(start=day, end=day, dir=dir)
+        daily_data = daily_frames.get(day)
         if daily_data is None:
             if verbose:
                 print(f"Skipping {day}, no data")
             continue
         
-        raw_dfs[day] = daily_data
-        # create a dataframe of everything in raw_dfs.values()
-        season_to_date = pd.concat(raw_dfs.values())
-        output[day] = get_money(season_to_date)
+        # add today's games to the running medians, instead of redoing get_money on the whole season so far
+        home_percents.update(zip(daily_data.home_names.tolist(), daily_data.home_percents.tolist()))
+        away_percents.update(zip(daily_data.away_names.tolist(), daily_data.away_percents.tolist()))
+        output[day] = home_percents.medians().add(away_percents.medians(), fill_value=50)
 
     return output
 
+def _pick(conditions, choices):
+    # np.select into an object column, None where nothing matches. (NaN comparisons
+    # are always False, so games with a missing line or score stay None.)
+    choices = [np.asarray(c, dtype=object) for c in choices]
+    return np.select(conditions, choices, default=None)
+
 def handle_money_wl(df):
     ## name of the teams with the most/least money bet in this game.
-    df['money_winner'] = None
-    df['money_loser'] = None
+    away_percents = df.away_percents.to_numpy()
+    away_names = df.away_names.to_numpy(dtype=object)
+    home_names = df.home_names.to_numpy(dtype=object)
 
-    df.loc[(df.away_percents > 50), 'money_winner'] = df.loc[(df.away_percents > 50), 'away_names']
-    df.loc[(df.away_percents > 50), 'money_loser' ] = df.loc[(df.away_percents > 50), 'home_names']
+    away_money = away_percents > 50
+    home_money = away_percents < 50
 
-    df.loc[(df.away_percents < 50), 'money_winner'] = df.loc[(df.away_percents < 50), 'home_names']
-    df.loc[(df.away_percents < 50), 'money_loser' ] = df.loc[(df.away_percents < 50), 'away_names']
+    df['money_winner'] = _pick([away_money, home_money], [away_names, home_names])
+    df['money_loser']  = _pick([away_money, home_money], [home_names, away_names])
 
     return df
 
 def handle_lines(df):
     # extract the opening (away) lines
-    open_away_lines = df.away_opens.str.extract(r'([\d\.\+\-]+)([\-\+][\d]+)')
-    df['open_away_spread']  = open_away_lines[0].astype("float")
-    df['open_away_vig']     = open_away_lines[1].astype("float")
+    (df['open_away_spread'], df['open_away_vig']) = _split_lines(df.away_opens)
 
     ## extract the closing away lines.
-    lines = df.away_lines.str.extract(r'([\d\.\+\-]+)([\-\+][\d]+)')
-    df['away_spread'] = lines[0].astype("float")
-    df['away_vig'] = lines[1].astype("float")
+    (df['away_spread'], df['away_vig']) = _split_lines(df.away_lines)
 
     df['score_diff'] = df['away_scores'] - df['home_scores']
 
@@ -124,133 +370,312 @@ def handle_lines(df):
     df['with_line'] = df['score_diff'] + df['away_spread']
     df['open_with_line'] = df['score_diff'] + df['open_away_spread']
 
-    # if with_line < 0, then the away team lost, otherwise they won ATS
-    df['winner_ats'] = None
-
-    df.loc[df.with_line > 0, 'winner_ats'] = 'AWAY'
-    df.loc[df.with_line < 0, 'winner_ats'] = 'HOME'
-
-    df['open_winner_ats'] = None
-    df.loc[df.open_with_line > 0, 'open_winner_ats'] = 'AWAY'
-    df.loc[df.open_with_line < 0, 'open_winner_ats'] = 'HOME'
+    with_line = df.with_line.to_numpy(dtype=float)
+    open_with_line = df.open_with_line.to_numpy(dtype=float)
+    away_spread = df.away_spread.to_numpy(dtype=float)
+    open_away_spread = df.open_away_spread.to_numpy(dtype=float)
 
+    # if with_line < 0, then the away team lost, otherwise they won ATS. exactly 0 is a push (None)
+    away_won = with_line > 0
+    home_won = with_line < 0
+    df['winner_ats'] = _pick([away_won, home_won], ['AWAY', 'HOME'])
+    df['open_winner_ats'] = _pick([open_with_line > 0, open_with_line < 0], ['AWAY', 'HOME'])
 
     # if away_spread > 0 and with_line > 0: away underdog won
     #                        with_line < 0: away favorite won
-    away_dogs  = ((df.away_spread > 0) & (df.with_line > 0))
-    away_faves = ((df.away_spread > 0) & (df.with_line < 0))
-
     # if away_spread < 0 and with_line > 0: home favorite won
-    #                                  < 0: home underdog won                             
-    home_faves = ((df.away_spread < 0) & (df.with_line > 0))
-    home_dogs  = ((df.away_spread < 0) & (df.with_line < 0))
-    df['fave_dog'] = None
+    #                                  < 0: home underdog won
+    # so it's a DOG win when the spread and the result have the same sign.
+    df['fave_dog'] = _fave_dog(away_spread, with_line)
+    df['open_fave_dog'] = _fave_dog(open_away_spread, open_with_line)
 
-    df.loc[away_dogs, 'fave_dog']  = "DOG"
-    df.loc[away_faves, 'fave_dog'] = "FAVE"
+    # add the name of the winner/loser against the spread.
+    away_names = df.away_names.to_numpy(dtype=object)
+    home_names = df.home_names.to_numpy(dtype=object)
+    df['winner_ats_name'] = _pick([away_won, home_won], [away_names, home_names])
+    df['loser_ats_name']  = _pick([away_won, home_won], [home_names, away_names])
 
-    df.loc[home_faves, 'fave_dog'] = "FAVE"
-    df.loc[home_dogs, 'fave_dog']  = "DOG"
+    return df
 
-########################
-    df['open_fave_dog'] = None
-    open_away_dogs  = ((df.open_away_spread > 0) & (df.open_with_line > 0))
-    open_away_faves = ((df.open_away_spread > 0) & (df.open_with_line < 0))
+def _split_lines(lines):
+    """
+    "-3.5-110" -> (-3.5, -110.0) for a column of lines. There are only a few hundred
+    different lines in a season, so run the regex on those and spread the results back out.
+    """
+    (codes, uniques) = pd.factorize(lines)
+    extracted = pd.Series(uniques, dtype=object).str.extract(r'([\d\.\+\-]+)([\-\+][\d]+)')
+    spread = np.append(extracted[0].astype("float").to_numpy(), np.nan)[codes]
+    vig = np.append(extracted[1].astype("float").to_numpy(), np.nan)[codes]
+    return (pd.Series(spread, index=lines.index), pd.Series(vig, index=lines.index))
+
+def _fave_dog(spread, with_line):
+    dogs  = ((spread > 0) & (with_line > 0)) | ((spread < 0) & (with_line < 0))
+    faves = ((spread > 0) & (with_line < 0)) | ((spread < 0) & (with_line > 0))
+    return _pick([dogs, faves], ['DOG', 'FAVE'])
+
+## cleaned data for recently used (dir, start, end) ranges, most recent last.
+## see _cached_clean_data. fetch_data_range clears it after writing new files.
+CLEAN_CACHE_SIZE = 16
+_clean_cache = OrderedDict()
+
+def clean_data(start=START_DATE, end=END_DATE, dir='sbr', categorical=False):
+    """
+    categorical=True gives back the compact version (see to_categorical)
+    """
+    (df, days) = _cached_clean_data(start=start, end=end, dir=dir)
+    if df is None:
+        return None
+    # callers add columns to this (eg fade_the_public), so never hand out the cached one.
+    df = df.copy()
+    if categorical:
+        df = to_categorical(df)
+    return df
 
-    # if away_spread < 0 and with_line > 0: home favorite won
-    #                                  < 0: home underdog won                             
-    open_home_faves = ((df.open_away_spread < 0) & (df.open_with_line > 0))
-    open_home_dogs  = ((df.open_away_spread < 0) & (df.open_with_line < 0))
-    
-    df.loc[open_away_dogs, 'open_fave_dog']  = "DOG"
-    df.loc[open_away_faves, 'open_fave_dog'] = "FAVE"
+def clean_raw_data(raw_data):
+    # throw out rows where this site doesn't have the scores.
+    # there were some missing when I started this, but they're filled in now.
+    missing_scores = sum((raw_data.home_scores == 0))
+    if missing_scores > 0:
+        print(f"missing scores from {missing_scores} games")
+    df = raw_data[~(raw_data.home_scores == 0)].copy()
+    df = handle_lines(df)
+    df = handle_money_wl(df)
+    return df
 
-    df.loc[open_home_faves, 'open_fave_dog'] = "FAVE"
-    df.loc[open_home_dogs, 'open_fave_dog']  = "DOG"
+def clean_data_by_day(start=START_DATE, end=END_DATE, dir='sbr'):
+    """
+    Same as calling clean_data(start=day, end=day) for every day in the range,
+    but only reads and cleans the data once. Returns {day: df}, days without data are left out.
+    """
+    (df, days) = _cached_clean_data(start=start, end=end, dir=dir)
+    if df is None:
+        return {}
 
+    by_day = {day: rows.reset_index(drop=True) for (day, rows) in df.groupby('game_date', sort=False)}
 
+    # a day can have a file but no games left after dropping missing scores.
+    # clean_data would give back an empty frame for that day, not None.
+    return {day: by_day[day] if day in by_day else df.iloc[0:0].copy() for day in days}
 
-    # add the name of the winner/loser against the spread.
-    df['winner_ats_name'] = None
-    df['loser_ats_name'] = None
+def _data_signature(start, end, dir):
+    # modification times of everything clean_data would read for this range (the daily
+    # csv files and the season stores). if any of these change, the cached copy is stale.
+    paths = [f"{dir}/{date}.csv" for date in pd.date_range(start, end).strftime("%Y-%m-%d")]
+    seasons = range(season_store.season_for_date(start), season_store.season_for_date(end) + 1)
+    paths += [season_store.store_path(season, dir) for season in seasons]
 
-    away_winners = df['winner_ats'] == 'AWAY'
-    home_winners = df['winner_ats'] == 'HOME'
- 
-    df.loc[away_winners, 'winner_ats_name'] = df.loc[away_winners, 'away_names']
-    df.loc[away_winners, 'loser_ats_name'] = df.loc[away_winners, 'home_names']
+    signature = []
+    for path in paths:
+        try:
+            signature.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
 
-    df.loc[home_winners, 'winner_ats_name'] = df.loc[home_winners, 'home_names']
-    df.loc[home_winners, 'loser_ats_name'] = df.loc[home_winners, 'away_names']
+def _cached_clean_data(start=START_DATE, end=END_DATE, dir='sbr'):
+    """
+    clean_data with an in-process LRU cache, keyed on (dir, start, end) and the mtimes
+    of the files underneath. Returns (df, days with data). Don't modify the df.
+    """
+    start = pd.Timestamp(start).strftime("%Y-%m-%d")
+    end = pd.Timestamp(end).strftime("%Y-%m-%d")
+    key = (os.path.abspath(dir), start, end)
+    signature = _data_signature(start, end, dir)
 
-    return df
+    if key in _clean_cache and _clean_cache[key][0] == signature:
+        _clean_cache.move_to_end(key)
+        return _clean_cache[key][1]
 
-def clean_data(start=START_DATE, end=END_DATE, dir='sbr'):
     raw_data = merge_existing_data(start=start, end=end, dir=dir)
-
-    if raw_data is not None:
-        # throw out rows where this site doesn't have the scores.
-        # there were some missing when I started this, but they're filled in now.
-        missing_scores = sum((raw_data.home_scores == 0))
-        if missing_scores > 0:
-            print(f"missing scores from {missing_scores} games")
-        df = raw_data[~(raw_data.home_scores == 0)].copy()
-        df = handle_lines(df)
-        df = handle_money_wl(df)
-        return df
-    return None
+    if raw_data is None:
+        result = (None, [])
+    else:
+        result = (clean_raw_data(raw_data), list(raw_data.game_date.unique()))
+
+    _clean_cache[key] = (signature, result)
+    _clean_cache.move_to_end(key)
+    while len(_clean_cache) > CLEAN_CACHE_SIZE:
+        _clean_cache.popitem(last=False)
+    return result
+
+def invalidate_clean_data_cache(dir=None):
+    # forget cached clean_data results, for one data directory or all of them.
+    if dir is None:
+        _clean_cache.clear()
+        return
+    dir = os.path.abspath(dir)
+    for key in [k for k in _clean_cache if k[0] == dir]:
+        del _clean_cache[key]
 
 def merge_existing_data(start=START_DATE, end=END_DATE, dir='sbr'):
     range = pd.date_range(start, end).strftime("%Y-%m-%d")
+    if len(range) == 0:
+        return None
+
+    # anything in a season store is already parsed. only go to the csv files for days
+    # the stores don't have yet, or whose csv changed (or went away) since the store was built.
+    (stored, stored_dates) = season_store.load_range(range[0], range[-1], dir=dir)
 
     dfs = []
+    if stored is not None:
+        dfs.append(stored)
     for date in range:
-        (year, month, day) = date.split("-")
-        try:
-            df_on = pd.read_csv(f"{dir}/{year}-{month}-{day}.csv")
-            df_on['game_date'] = f"{year}-{month}-{day}"
+        if date in stored_dates:
+            continue
+        df_on = season_store.read_day_csv(date, dir=dir)
+        if df_on is not None:
             dfs.append(df_on)
-        except:
-            #print(f"failed on {date}")
-            pass
 
-    if len(dfs) > 0:   
-        return pd.concat(dfs, ignore_index=True)
-    else:
+    if len(dfs) == 0:
         return None
+    merged = pd.concat(dfs, ignore_index=True)
+    if stored is not None and len(dfs) > 1:
+        # put the csv days back in date order with the stored ones.
+        merged = merged.sort_values('game_date', kind='stable', ignore_index=True)
+    return merged
+
+class TokenBucket:
+    """
+    Thread-safe rate limiter. Allows `rate` requests per second on average,
+    with bursts of up to `burst` requests.
+    """
+    def __init__(self, rate=1/1.23, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def make_session(pool_size=4):
+    # one pooled session for all requests, so we're not opening a new connection for every day.
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def fetch_page(url, session=None, limiter=None, retries=3, backoff=2.0):
+    """
+    GET a page, retrying connection errors, 429s and 5xx errors with exponential backoff.
+    """
+    if session is None:
+        session = requests
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            req = session.get(url, timeout=30)
+            if req.status_code == 429 or req.status_code >= 500:
+                req.raise_for_status()
+            return req.content
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            wait = backoff * (2 ** (attempt - 1))
+            print(f"retrying {url} in {wait}s ({e})")
+            time.sleep(wait)
+
+def fetch_data_range(start, end, dir='sbr', workers=1, rate=1/1.23, burst=1,
+                     retries=3, backoff=2.0, base_url=SAMPLE_PAGE, session=None, parser='bs4'):
+    """
+    Scrape every day in the range we don't already have on disk.
 
-def fetch_data_range(start, end, dir='sbr'):
+    workers is how many requests can be in flight at once, and rate/burst is the
+    token bucket that keeps us polite (default is about one request every 1.23 seconds,
+    which is what this used to sleep between days). base_url can point at a local
+    server for testing.
+    """
     range = pd.date_range(start, end).strftime("%Y-%m-%d")
-    new_scrapes = []
+    limiter = TokenBucket(rate=rate, burst=burst)
+    if session is None:
+        session = make_session(pool_size=workers)
+
+    to_fetch = []
     for date in range:
+        if not os.path.exists(f"{dir}/{date}.csv"):
+            ### This is new data, or we are re-scraping.
+            to_fetch.append(date)
+        else:
+            print(f"already got for {date}")
+
+    def fetch_one(date):
         print(f"On {date}")
         (year, month, day) = date.split("-")
-
-        if not os.path.exists(f"{dir}/{year}-{month}-{day}.csv"):
-            ### This is new data, or we are re-scraping.
+        return get_for_date(year, month, day, dir, session=session, limiter=limiter,
+                            retries=retries, backoff=backoff, base_url=base_url, parser=parser)
+
+    scraped_by_date = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_one, date): date for date in to_fetch}
+        for future in as_completed(futures):
+            date = futures[future]
             try:
-                scraped = get_for_date(year, month, day, dir)
-                new_scrapes.append(scraped)
-                time.sleep(1.23)
+                scraped_by_date[date] = future.result()
             except Exception as e:
                 print(f"choked on {date}")
                 print(e)
-        else:
-            print(f"already got for {date}")
+
+    new_scrapes = [scraped_by_date[date] for date in to_fetch if date in scraped_by_date]
+
+    if len(new_scrapes) > 0:
+        # fold the new days into the season stores
+        for season in sorted(set(season_store.season_for_date(d) for d in range)):
+            season_store.update_season_store(season, dir=dir)
+        invalidate_clean_data_cache(dir)
     return new_scrapes
 
 
-def get_for_date(year, month, day, dir='sbr', save_csv=True):
-    url = f"https://www.sportsbookreview.com/betting-odds/nba-basketball/?date={year}-{month}-{day}"
-    req = requests.get(url)
-    data = req.content
-    scraped = scrape_a_page(data)
+def get_for_date(year, month, day, dir='sbr', save_csv=True, session=None, limiter=None,
+                 retries=0, backoff=2.0, base_url=SAMPLE_PAGE, parser='bs4'):
+    url = f"{base_url}?date={year}-{month}-{day}"
+    data = fetch_page(url, session=session, limiter=limiter, retries=retries, backoff=backoff)
+    if save_csv:
+        # keep the raw page (before parsing, in case the parse fails) so it can be
+        # re-parsed later without downloading it again. see html_archive.
+        html_archive.save_page(f"{int(year):04d}-{int(month):02d}-{int(day):02d}", data, dir=dir)
+    scraped = scrape_a_page(data, parser=parser)
     if save_csv:
         out_name = f"{dir}/{year}-{month}-{day}.csv"
-        scraped.to_csv(out_name)
+        write_csv_atomic(scraped, out_name)
     return scraped
 
-def scrape_a_page(data):
+def write_csv_atomic(df, out_name):
+    # write next to the real file and rename it over, so an interrupted scrape never
+    # leaves half a csv behind (which fetch_data_range would then skip forever)
+    tmp_name = f"{out_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_csv(tmp_name)
+        os.replace(tmp_name, out_name)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+def scrape_a_page(data, parser='bs4'):
+    """
+    Pull the ten columns out of a sportsbookreview NBA odds page.
+
+    parser='bs4' is the original BeautifulSoup version. parser='lxml' does the same
+    thing in a single walk over an lxml tree, which is a lot faster when re-parsing
+    a whole season of saved pages. (see benchmarks.bench_parsers)
+    """
+    if parser == 'lxml':
+        return _scrape_a_page_lxml(data)
+    elif parser != 'bs4':
+        raise ValueError(f"unknown parser {parser}")
 
     soup = bs.BeautifulSoup(data,'html.parser')
     table_soup = soup.find(id='tbody-nba')
@@ -343,4 +768,102 @@ def scrape_a_page(data):
                         'home_lines':home_lines, 
                         'home_scores': home_scores, 
                         'home_percents': home_percents,
-                        'home_opens': home_opens})
\ No newline at end of file
+                        'home_opens': home_opens})
+
+def _has_class(classes, name):
+    # same as bs4's class_=re.compile(name): a substring of any one of the classes
+    return any(name in c for c in classes)
+
+def _scrape_a_page_lxml(data):
+    if lxml_html is None:
+        raise ImportError("parser='lxml' needs the lxml package")
+
+    tree = lxml_html.fromstring(data)
+    tables = tree.xpath("//*[@id='tbody-nba']")
+    if len(tables) == 0:
+        raise ValueError("no tbody-nba on this page")
+
+    columns = {name: [] for name in ['away_names', 'away_lines', 'away_scores', 'away_percents', 
+                                     'away_opens', 'home_names', 'home_lines', 'home_scores', 
+                                     'home_percents', 'home_opens']}
+
+    ## state for the single walk. each of these is the element we're currently inside of.
+    participant = None
+    team_name = None
+    team_score = None
+    away_done = None
+
+    row = None
+    odds_cells = 0
+    consensus_columns = 0
+    consensus = None
+    percent_side = 'away'
+    open_cells = []
+
+    for (event, el) in etree.iterwalk(tables[0], events=("start", "end")):
+        cls = el.get("class")
+        if cls is None:
+            continue
+        classes = cls.split()
+
+        if event == "end":
+            if el is participant:
+                if away_done is None:
+                    away_done = team_name
+                    columns['away_names'].append(team_name)
+                    columns['away_scores'].append(team_score)
+                else:
+                    columns['home_names'].append(team_name)
+                    columns['home_scores'].append(team_score)
+                    away_done = None
+                participant = None
+            elif el is consensus:
+                consensus = None
+            elif el is row:
+                if consensus_columns < 2:
+                    raise ValueError("missing consensus columns")
+                columns['away_opens'].append(open_cells[0])
+                columns['home_opens'].append(open_cells[2])
+                row = None
+            continue
+
+        if participant is not None:
+            if team_name is None and _has_class(classes, "GameRows_participantBox"):
+                team_name = el.text_content()
+            if team_score is None and _has_class(classes, "GameRows_scores"):
+                team_score = el.text_content()
+        if _has_class(classes, "GameRows_participantContainer"):
+            participant = el
+            team_name = None
+            team_score = None
+
+        if row is not None:
+            if _has_class(classes, "OddsCells_compact"):
+                # just taking the first one, BetMGM. there are other casinos.
+                if odds_cells == 0:
+                    columns['away_lines'].append(el.text_content())
+                elif odds_cells == 1:
+                    columns['home_lines'].append(el.text_content())
+                odds_cells += 1
+
+            if consensus is not None and "me-2" in classes:
+                if consensus_columns == 1:
+                    percent_int = int(el.text_content()[:-1])
+                    columns[f"{percent_side}_percents"].append(percent_int)
+                    percent_side = 'home' if percent_side == 'away' else 'away'
+                elif consensus_columns == 2:
+                    # get opening lines
+                    open_cells.append(el.text_content())
+
+            if consensus is None and _has_class(classes, "GameRows_consensusColumn"):
+                consensus = el
+                consensus_columns += 1
+        if _has_class(classes, "GameRows_containerTable"):
+            row = el
+            odds_cells = 0
+            consensus_columns = 0
+            consensus = None
+            percent_side = 'away'
+            open_cells = []
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,225 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+"""
+One consolidated file per season for the daily sportsbookreview csv files.
+
+Each season is a numpy .npz file ({dir}/season_2024.npz for the 2024-25 season) with
+one typed array per column, plus a date index (`dates` + `offsets`) so a date range is
+just a slice. It's built from the daily csv files and kept up to date incrementally --
+only csv files that are new or have changed since the last build get parsed again.
+
+merge_existing_data() in scrape_sbr reads from here and falls back to the csv files for
+any days that aren't in a store, or whose csv has changed or been deleted since the store
+was built. fetch_data_range updates the stores after it scrapes; if you change csv files
+by hand, update_all_stores() folds them back into the stores so they're fast again.
+"""
+
+CSV_NAME = re.compile(r"^(\d{4})-(\d{2})-(\d{2})\.csv$")
+
+## loaded stores, keyed by path -> (mtime, store). so each season is only read off disk once.
+_loaded = {}
+
+
+def season_for_date(date):
+    # the NBA season starts in October, so Jan-July belongs to the previous year's season.
+    date = pd.Timestamp(date)
+    if date.month >= 8:
+        return date.year
+    return date.year - 1
+
+def store_path(season, dir='sbr'):
+    return f"{dir}/season_{season}.npz"
+
+def read_day_csv(date, dir='sbr'):
+    path = f"{dir}/{date}.csv"
+    if not os.path.exists(path):
+        return None
+    df_on = pd.read_csv(path)
+    df_on['game_date'] = date
+    return df_on
+
+def csv_dates(dir='sbr', season=None):
+    # dates of all the daily csv files on disk (optionally for just one season)
+    dates = []
+    if not os.path.isdir(dir):
+        return dates
+    for name in os.listdir(dir):
+        match = CSV_NAME.match(name)
+        if match is None:
+            continue
+        date = "-".join(match.groups())
+        if season is None or season_for_date(date) == season:
+            dates.append(date)
+    return sorted(dates)
+
+
+def _to_arrays(df):
+    # split a frame into typed numpy arrays. strings get stored as fixed-width
+    # unicode with a separate missing-value mask, since npz can't hold python objects.
+    arrays = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype.kind in "biuf":
+            arrays[f"col:{col}"] = values.to_numpy()
+        else:
+            missing = values.isna().to_numpy()
+            arrays[f"col:{col}"] = values.fillna("").astype(str).to_numpy(dtype=str)
+            arrays[f"na:{col}"] = missing
+    return arrays
+
+def _from_arrays(store, columns, rows=slice(None)):
+    data = {}
+    for col in columns:
+        values = store[f"col:{col}"][rows]
+        if f"na:{col}" in store:
+            values = values.astype(object)
+            values[store[f"na:{col}"][rows]] = np.nan
+        data[col] = values
+    return pd.DataFrame(data, columns=columns)
+
+
+def load_store(season, dir='sbr'):
+    """
+    Returns the season store as a dict of arrays, or None if it hasn't been built.
+    """
+    path = store_path(season, dir)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if path in _loaded and _loaded[path][0] == mtime:
+        return _loaded[path][1]
+
+    with np.load(path, allow_pickle=False) as npz:
+        store = {key: npz[key] for key in npz.files}
+    _loaded[path] = (mtime, store)
+    return store
+
+def _unchanged(dates, mtimes, dir):
+    # which stored days still match their csv file. mtime 0 means the day never had a
+    # csv (eg synthetic.write_stores), so the store is all there is.
+    fresh = np.ones(len(dates), dtype=bool)
+    for (i, (date, mtime)) in enumerate(zip(dates.tolist(), mtimes.tolist())):
+        if mtime == 0:
+            continue
+        try:
+            fresh[i] = os.path.getmtime(f"{dir}/{date}.csv") == mtime
+        except FileNotFoundError:
+            fresh[i] = False
+    return fresh
+
+def load_range(start, end, dir='sbr'):
+    """
+    Get every stored row between start and end (inclusive), in the same shape as
+    merge_existing_data. Returns (df or None, set of dates the stores had).
+
+    Days whose csv was edited or deleted after the store was built are left out
+    (rows and dates both), so the caller goes back to the csv for them.
+    """
+    start = pd.Timestamp(start).strftime("%Y-%m-%d")
+    end = pd.Timestamp(end).strftime("%Y-%m-%d")
+
+    dfs = []
+    covered = set()
+    for season in range(season_for_date(start), season_for_date(end) + 1):
+        store = load_store(season, dir)
+        if store is None:
+            continue
+        dates = store['dates']
+        offsets = store['offsets']
+
+        first = np.searchsorted(dates, start, side='left')
+        last = np.searchsorted(dates, end, side='right')
+        if first == last:
+            continue
+        day_dates = dates[first:last]
+        counts = np.diff(offsets[first:last + 1])
+        fresh = _unchanged(day_dates, store['mtimes'][first:last], dir)
+        if not fresh.any():
+            continue
+        covered.update(day_dates[fresh].tolist())
+
+        rows = slice(offsets[first], offsets[last])
+        df = _from_arrays(store, store['columns'].tolist(), rows)
+        df['game_date'] = np.repeat(day_dates, counts).astype(object)
+        if not fresh.all():
+            df = df[np.repeat(fresh, counts)].reset_index(drop=True)
+        dfs.append(df)
+
+    if len(dfs) == 0:
+        return (None, covered)
+    return (pd.concat(dfs, ignore_index=True), covered)
+
+
+def update_season_store(season, dir='sbr', verbose=False):
+    """
+    Build or refresh the store for a season from the daily csv files.
+
+    Days that are already in the store and whose csv hasn't changed are reused
+    as-is, so this only parses the new files. Returns the number of days parsed.
+    """
+    store = load_store(season, dir)
+
+    on_disk = csv_dates(dir, season)
+    mtimes = {date: os.path.getmtime(f"{dir}/{date}.csv") for date in on_disk}
+
+    stored_mtimes = {}
+    if store is not None:
+        stored_mtimes = dict(zip(store['dates'].tolist(), store['mtimes'].tolist()))
+
+    keep = [date for date in on_disk if stored_mtimes.get(date) == mtimes[date]]
+    parse = [date for date in on_disk if stored_mtimes.get(date) != mtimes[date]]
+    if len(parse) == 0 and len(keep) == len(stored_mtimes):
+        return 0
+
+    day_frames = {}
+    if store is not None and len(keep) > 0:
+        offsets = store['offsets']
+        index = {date: i for (i, date) in enumerate(store['dates'].tolist())}
+        columns = store['columns'].tolist()
+        for date in keep:
+            i = index[date]
+            day_frames[date] = _from_arrays(store, columns, slice(offsets[i], offsets[i + 1]))
+    for date in parse:
+        if verbose:
+            print(f"parsing {date}")
+        day_frames[date] = pd.read_csv(f"{dir}/{date}.csv")
+
+    if len(day_frames) == 0:
+        return 0
+    write_store(season, day_frames, dir=dir, mtimes=mtimes)
+    return len(parse)
+
+def write_store(season, day_frames, dir='sbr', mtimes=None):
+    """
+    Write {date: frame} as the whole store for a season, replacing what was there.
+
+    mtimes are the csv modification times update_season_store checks against.
+    Days with no csv (eg synthetic data) get 0, and the next update_season_store
+    will drop them, since it only keeps days it can find a csv for.
+    """
+    if mtimes is None:
+        mtimes = {}
+    path = store_path(season, dir)
+    dates = sorted(day_frames.keys())
+    counts = [len(day_frames[date]) for date in dates]
+    df = pd.concat([day_frames[date] for date in dates], ignore_index=True)
+
+    arrays = _to_arrays(df)
+    arrays['columns'] = np.array(df.columns.tolist(), dtype=str)
+    arrays['dates'] = np.array(dates, dtype=str)
+    arrays['offsets'] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    arrays['mtimes'] = np.array([mtimes.get(date, 0) for date in dates], dtype=np.float64)
+
+    # write to a temp file and swap it in, so a reader never sees half a store.
+    os.makedirs(dir, exist_ok=True)
+    tmp_path = f"{dir}/season_{season}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    _loaded.pop(path, None)
+
+def update_all_stores(dir='sbr', verbose=False):
+    seasons = sorted(set(season_for_date(date) for date in csv_dates(dir)))
+    return {season: update_season_store(season, dir, verbose=verbose) for season in seasons}
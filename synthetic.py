@@ -0,0 +1,226 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import scrape_sbr
+import season_store
+
+"""
+Fake seasons of sportsbookreview data, for load testing and benchmarks.
+
+Each day is a frame with the same ten columns scrape_a_page gives back (and the
+daily csv files have), eg away_lines like "-3.5-110", away_percents 0-100, scores.
+Everything is drawn in one go with numpy per season and only split up into days
+at the end, so 100 seasons takes seconds.
+
+How the games get made up:
+  - every team has a strength rating each season (points better than average), and
+    the fair spread is the difference plus home court.
+  - the public bets on popular teams (same teams every season, like the Lakers) and
+    on favorites. public_bias is how strongly; 0 is a coin flip around 50%.
+  - the closing line gets shaded `shading` points against the side the public is on
+    (at 100% of the money), so with shading > 0 fading the public wins more than half.
+  - the final margin is the fair spread, give or take about 12 points.
+
+    games = synthetic_games(seasons=10, public_bias=1, shading=1)
+    write_csvs(games, 'sbr_fake')       # daily csv files, like fetch_data_range
+    write_stores(games, 'sbr_fake')     # or one season_store file per season
+
+sbr_page turns a day back into a page scrape_a_page can read (just the parts it
+looks at), for testing the parsers without any saved pages.
+"""
+
+SPREADS = np.arange(-30, 31) / 2
+VIGS = np.array([-105, -108, -110, -112, -115])
+VIG_ODDS = np.array([.05, .1, .7, .1, .05])
+# spread strings like "+3.5", "-7", "+0", looked up by index instead of formatted per game
+SPREAD_STRINGS = np.array([f"{spread:+g}" for spread in SPREADS], dtype=object)
+VIG_STRINGS = np.array([f"{vig:+d}" for vig in VIGS], dtype=object)
+
+HOME_COURT = 2.5
+MARGIN_STD = 12
+COLUMNS = ['away_names', 'away_lines', 'away_scores', 'away_percents', 'away_opens',
+           'home_names', 'home_lines', 'home_scores', 'home_percents', 'home_opens']
+
+
+def team_names(teams=30):
+    # the real teams first, then made up ones if you ask for more than 30
+    names = list(scrape_sbr.NBA_TEAMS[:teams])
+    names += [f"Team {i + 1}" for i in range(len(names), teams)]
+    return np.array(names, dtype=object)
+
+def _lines(spread_index, vig_index):
+    return SPREAD_STRINGS[spread_index] + VIG_STRINGS[vig_index]
+
+def _spread_index(spread):
+    # nearest half point, and nothing past +/- 15
+    return np.clip(np.round(spread * 2).astype(np.int64) + (len(SPREADS) // 2), 0, len(SPREADS) - 1)
+
+def _draw_games(rng, names, day_counts, ratings, popularity, public_bias=0.0, shading=0.0):
+    # one block of days. day_counts[d] is how many games on day d.
+    teams = len(names)
+    slots = teams // 2
+    n = int(day_counts.sum())
+
+    # shuffle the teams for each day and pair them off, so nobody plays twice in a day
+    order = rng.permuted(np.tile(np.arange(teams), (len(day_counts), 1)), axis=1)
+    playing = np.arange(slots) < day_counts[:, None]
+    away = order[:, 0:2 * slots:2][playing]
+    home = order[:, 1:2 * slots:2][playing]
+
+    # the away spread: points the away team gets. positive = away is the underdog
+    fair = ratings[home] + HOME_COURT - ratings[away]
+
+    # the public likes popular teams and favorites. lean > 0 is money on the away team
+    lean = public_bias * ((popularity[away] - popularity[home]) - (fair / 6))
+    away_percents = np.clip(np.round(50 + (10 * lean) + rng.normal(0, 12, n)), 1, 99).astype(np.int64)
+
+    # books shade the line against the public side
+    close = _spread_index(fair - shading * (away_percents - 50) / 50)
+    open_ = np.clip(close + rng.integers(-2, 3, n), 0, len(SPREADS) - 1)
+    away_vig = rng.choice(len(VIGS), n, p=VIG_ODDS)
+    home_vig = rng.choice(len(VIGS), n, p=VIG_ODDS)
+    open_vig = rng.choice(len(VIGS), n, p=VIG_ODDS)
+    # the home line is the same number the other way around
+    flip = len(SPREADS) - 1
+
+    home_scores = np.round(rng.normal(112, 12, n)).astype(np.int64)
+    away_scores = home_scores + np.round(rng.normal(-fair, MARGIN_STD)).astype(np.int64)
+
+    return pd.DataFrame({
+        'away_names': names[away],
+        'away_lines': _lines(close, away_vig),
+        'away_scores': away_scores,
+        'away_percents': away_percents,
+        'away_opens': _lines(open_, open_vig),
+        'home_names': names[home],
+        'home_lines': _lines(flip - close, home_vig),
+        'home_scores': home_scores,
+        'home_percents': 100 - away_percents,
+        'home_opens': _lines(flip - open_, open_vig),
+    })
+
+def synthetic_games(seasons=1, first_season=2024, teams=30, games_per_team=82, season_days=170,
+                    public_bias=1.0, shading=0.0, seed=2718):
+    """
+    All the games for `seasons` seasons in one frame, with a game_date column.
+
+    Each season starts October 22nd and runs `season_days` days, with about
+    teams * games_per_team / 2 games spread over them (and the odd day off).
+    """
+    rng = np.random.default_rng(seed)
+    names = team_names(teams)
+    popularity = rng.normal(0, 1, teams)
+    games_per_day = teams * games_per_team / 2 / season_days
+
+    frames = []
+    for season in range(first_season, first_season + seasons):
+        dates = pd.date_range(f"{season}-10-22", periods=season_days).strftime("%Y-%m-%d")
+        day_counts = np.minimum(rng.poisson(games_per_day, season_days), teams // 2)
+        day_counts[rng.random(season_days) < .04] = 0
+
+        ratings = rng.normal(0, 4, teams)
+        df = _draw_games(rng, names, day_counts, ratings, popularity, public_bias, shading)
+        df.insert(0, 'game_date', np.repeat(np.asarray(dates, dtype=object), day_counts))
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+def synthetic_season(teams=30, days=160, games_per_day=8, start="2024-10-22", public_bias=0.0,
+                     shading=0.0, seed=2718):
+    """
+    {date: frame} for `days` days in a row starting at `start`, exactly
+    `games_per_day` games every day. (benchmarks uses this, so the sizes are exact.)
+    """
+    if 2 * games_per_day > teams:
+        raise ValueError(f"can't have {games_per_day} games a day with {teams} teams")
+    rng = np.random.default_rng(seed)
+    names = team_names(teams)
+    ratings = rng.normal(0, 4, teams)
+    popularity = rng.normal(0, 1, teams)
+
+    df = _draw_games(rng, names, np.full(days, games_per_day), ratings, popularity, public_bias, shading)
+    dates = pd.date_range(start, periods=days).strftime("%Y-%m-%d")
+    return {date: df.iloc[i * games_per_day:(i + 1) * games_per_day].reset_index(drop=True)
+            for (i, date) in enumerate(dates)}
+
+def by_day(games):
+    # synthetic_games output -> {date: frame with just the scrape_a_page columns}
+    return {date: day[COLUMNS].reset_index(drop=True)
+            for (date, day) in games.groupby('game_date', sort=True)}
+
+def write_season(season, dir='sbr'):
+    """
+    Write {date: frame} out as daily csv files, the same way fetch_data_range does.
+    Returns (first date, last date).
+    """
+    os.makedirs(dir, exist_ok=True)
+    for (date, df) in season.items():
+        scrape_sbr.write_csv_atomic(df, f"{dir}/{date}.csv")
+    scrape_sbr.invalidate_clean_data_cache(dir)
+    dates = sorted(season)
+    return (dates[0], dates[-1])
+
+def write_csvs(games, dir='sbr'):
+    return write_season(by_day(games), dir)
+
+def write_stores(games, dir='sbr'):
+    """
+    Write synthetic_games output straight to season_store files, no csv files.
+    Reads back exactly like the csv files would have (merge_existing_data reads
+    the stores first). Don't fetch_data_range into the same directory: updating
+    the store there drops every day that doesn't have a csv.
+    Returns (first date, last date).
+    """
+    days = by_day(games)
+    seasons = {}
+    for (date, df) in days.items():
+        # the csv files have the row number as their first column, and so does a store built from them
+        df = df.copy()
+        df.insert(0, 'Unnamed: 0', np.arange(len(df)))
+        seasons.setdefault(season_store.season_for_date(date), {})[date] = df
+    for (season, day_frames) in seasons.items():
+        season_store.write_store(season, day_frames, dir=dir)
+    scrape_sbr.invalidate_clean_data_cache(dir)
+    dates = sorted(days)
+    return (dates[0], dates[-1])
+
+
+## just enough of a sportsbookreview page for scrape_a_page: the class names it looks
+## for, plus a second sportsbook column and some script/nav noise around the table.
+def _participant(name, score):
+    return (f'<div class="GameRows_participantContainer__6Rpfq"><div class="GameRows_participantBox__0WCRz">'
+            f'<a href="#"><span>{name}</span></a></div><div class="GameRows_scores__YkN24 fw-bold">{score}</div></div>')
+
+def _odds(line):
+    # "-3.5-110" -> spread and vig in separate spans, like the real page
+    return (f'<div class="OddsCells_oddsNumber__u3rsp OddsCells_compact__cawia">'
+            f'<span class="fs-9">{line[:-4]}</span><span class="opacity-75">{line[-4:]}</span></div>')
+
+def sbr_page(day):
+    """
+    Fake sportsbookreview html for one day's frame (the scrape_a_page columns), so
+    scrape_a_page(sbr_page(day)) gives the frame back (with the scores as strings,
+    same as from a real page).
+    """
+    rows = []
+    for game in day.itertuples():
+        rows.append(
+            '<div class="GameRows_eventMarketGridContainer__GuplK GameRows_containerTable__2dX0N">'
+            '<div class="GameRows_participants__pd3Zj">'
+            f'{_participant(game.away_names, game.away_scores)}{_participant(game.home_names, game.home_scores)}</div>'
+            '<div class="GameRows_consensusColumn__AOd1q">'
+            f'<span class="me-2">{game.away_percents}%</span><span class="me-2">{game.home_percents}%</span></div>'
+            '<div class="GameRows_consensusColumn__AOd1q opener">'
+            f'<span class="me-2">{game.away_opens}</span><span class="me-2">o</span>'
+            f'<span class="me-2">{game.home_opens}</span><span class="me-2">u</span></div>'
+            f'<div class="OddsCells_sportbook"><div class="OddsCells_bet">{_odds(game.away_lines)}{_odds(game.home_lines)}</div></div>'
+            f'<div class="OddsCells_sportbook"><div class="OddsCells_bet">{_odds("-1.5-105")}{_odds("+1.5-115")}</div></div>'
+            '</div>')
+    return ('<html><head><title>NBA Odds</title><script>var row = "<div>";</script></head><body>'
+            '<div class="nav">menu</div><div id="tbody-nba">' + "\n".join(rows) + '</div><footer></footer></body></html>')
+
+def synthetic_pages(days=30, games_per_day=8, seed=2718):
+    # {date: page bytes} for a run of synthetic_season days
+    season = synthetic_season(days=days, games_per_day=games_per_day, seed=seed)
+    return {date: sbr_page(day).encode('utf-8') for (date, day) in season.items()}
@@ -0,0 +1,190 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+import fader
+import scrape_sbr
+import win_loss_report
+
+"""
+Walk-forward backtests for superfade, so tuning eliminate_top / window / thresholds
+doesn't just fit the season we're testing on.
+
+The games are split into folds by date: pick the best parameters on a training
+stretch, then bet them on the next `test_days` days with games, then move on.
+Only the test results count.
+
+Every grid point gets run over the whole range once (win/loss counts per date), and
+each fold just adds up its dates, so the folds themselves cost next to nothing. The
+expensive part is building the standings for each window, and that's what gets spread
+over worker processes. Each worker gets the cleaned season once, when it starts, not
+once per task, and builds the standings from it (already split up by day) instead of
+going back to disk. The standings always run from the start of the range, so a test
+day's picks are the same ones superfade would have made that day with the season's
+standings.
+"""
+
+## the cleaned season, set once in each worker process (see _init_worker)
+_games = None
+_dates = None
+_games_by_day = None
+
+def _init_worker(games, dates):
+    global _games, _dates, _games_by_day
+    _games = games
+    _dates = dates
+    _games_by_day = [(day, rows) for (day, rows) in games.groupby(games.game_date.astype(str), sort=True)]
+
+def _ats_for_range(first, last, window):
+    # scrape_sbr.get_ats_for_range, but off the games this worker already has
+    standings = scrape_sbr.RollingStandings(window=window)
+    output = {}
+    for (day, daily_data) in _games_by_day:
+        if first <= day <= last:
+            standings.add_day(daily_data)
+            output[day] = standings.standings()
+    return output
+
+def _window_records(window, thresholds, eliminate_top):
+    # per-date wins and losses for every (thresholds, eliminate_top) at one window
+    games = _games.copy()
+    rows = []
+    wins = []
+    losses = []
+    # standings for the range the picks cover, like superfade. almost always the same range.
+    ranks_for = {}
+    for (lower, upper) in thresholds:
+        picks = fader.fade_the_public(lower, upper, games=games)
+        dates = (str(picks.game_date.min()), str(picks.game_date.max()))
+        if dates not in ranks_for:
+            ranks_for[dates] = scrape_sbr.RankMatrix(_ats_for_range(dates[0], dates[1], window), 'ats_win_pct')
+        ranks = ranks_for[dates]
+
+        date_codes = np.searchsorted(_dates, picks.game_date.to_numpy(dtype=object).astype(str))
+        result = picks.winner_ats.astype(object)
+        won = (picks.fade.astype(object) == result).to_numpy()
+        graded = result.notna().to_numpy()
+
+        for top in eliminate_top:
+            kept = fader._superfade_mask(picks, fader._superfade_exclusions(ranks, top)) & graded
+            rows.append({'lower_thresh': lower, 'upper_thresh': upper, 'window': window, 'eliminate_top': top})
+            wins.append(np.bincount(date_codes[kept & won], minlength=len(_dates)))
+            losses.append(np.bincount(date_codes[kept & ~won], minlength=len(_dates)))
+    return (rows, wins, losses)
+
+def grid_records(games, eliminate_top=(3, 5, 7), lower_thresh=(49,), upper_thresh=(60,), window=(None, 20),
+                 workers=None):
+    """
+    Run every superfade combination over all of `games` (from clean_data). The
+    standings come from `games` too, so nothing gets read from disk.
+    Returns (grid, dates, wins, losses): grid has one row per combination, and
+    wins/losses are (combinations x dates) arrays of the record on each date.
+    """
+    dates = np.array(sorted(games.game_date.astype(str).unique()))
+    thresholds = list(product(lower_thresh, upper_thresh))
+
+    if workers is None or workers == 1:
+        _init_worker(games, dates)
+        parts = [_window_records(w, thresholds, eliminate_top) for w in window]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(games, dates)) as pool:
+            futures = [pool.submit(_window_records, w, thresholds, eliminate_top) for w in window]
+            parts = [future.result() for future in futures]
+
+    # object columns, so the parameters stay what was passed (window=None, eliminate_top=5)
+    grid = pd.DataFrame([row for part in parts for row in part[0]], dtype=object)
+    wins = np.array([row for part in parts for row in part[1]], dtype=np.int64)
+    losses = np.array([row for part in parts for row in part[2]], dtype=np.int64)
+    return (grid, dates, wins, losses)
+
+def make_folds(n_dates, train_days=40, test_days=10, step=None, expanding=False):
+    """
+    [(train_start, train_end, test_start, test_end)] as positions in the list of dates
+    with games (ends are exclusive). expanding=True keeps every day from the start in
+    the training set instead of a rolling `train_days`.
+    """
+    if step is None:
+        step = test_days
+    folds = []
+    test_start = train_days
+    while test_start < n_dates:
+        train_start = 0 if expanding else test_start - train_days
+        folds.append((train_start, test_start, test_start, min(test_start + test_days, n_dates)))
+        test_start += step
+    return folds
+
+def _score(wins, losses, metric, vig):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'units':
+            return wins - (vig * losses)
+        if metric == 'win_pct':
+            return wins / (wins + losses)
+        if metric == 'z_score':
+            return (wins - losses) / np.sqrt(wins + losses)
+    raise ValueError(f"unknown metric {metric}")
+
+def walk_forward(start=scrape_sbr.START_DATE, end=scrape_sbr.END_DATE, dir='sbr', games=None,
+                 eliminate_top=(3, 5, 7), lower_thresh=(49,), upper_thresh=(60,), window=(None, 20),
+                 train_days=40, test_days=10, step=None, expanding=False, metric='units',
+                 min_picks=20, vig=1.1, workers=None):
+    """
+    Walk-forward test of superfade over a grid of parameters.
+
+    For each fold, the combination with the best `metric` ('units', 'win_pct' or
+    'z_score') on the training days (with at least min_picks graded picks) gets bet on
+    the test days. Returns (folds, overall): one row per fold with what got picked and
+    how it did in and out of sample, and the out of sample record over every fold
+    (win_loss_report.win_loss_stats, so win_loss_report(overall.wins, overall.losses)
+    prints the usual report).
+    """
+    if games is None:
+        games = scrape_sbr.clean_data(start, end, dir)
+    (grid, dates, wins, losses) = grid_records(games, eliminate_top, lower_thresh, upper_thresh, window,
+                                               workers=workers)
+
+    # running totals, so any stretch of dates is one subtraction for every combination
+    zeros = np.zeros((len(grid), 1), dtype=np.int64)
+    cum_wins = np.hstack([zeros, np.cumsum(wins, axis=1)])
+    cum_losses = np.hstack([zeros, np.cumsum(losses, axis=1)])
+
+    params = grid.to_dict('records')
+    rows = []
+    for (fold, (train_start, train_end, test_start, test_end)) in enumerate(
+            make_folds(len(dates), train_days, test_days, step, expanding)):
+        train_wins = cum_wins[:, train_end] - cum_wins[:, train_start]
+        train_losses = cum_losses[:, train_end] - cum_losses[:, train_start]
+        score = _score(train_wins, train_losses, metric, vig)
+        score[(train_wins + train_losses) < min_picks] = np.nan
+        if np.all(np.isnan(score)):
+            continue
+        best = int(np.nanargmax(score))
+
+        rows.append({'fold': fold,
+                     'train_start': dates[train_start], 'train_end': dates[train_end - 1],
+                     'test_start': dates[test_start], 'test_end': dates[test_end - 1],
+                     **params[best],
+                     'train_wins': train_wins[best], 'train_losses': train_losses[best],
+                     'train_units': train_wins[best] - (vig * train_losses[best]),
+                     'wins': cum_wins[best, test_end] - cum_wins[best, test_start],
+                     'losses': cum_losses[best, test_end] - cum_losses[best, test_start]})
+
+    folds = pd.DataFrame(rows)
+    if len(folds) == 0:
+        raise ValueError("no folds had enough picks to train on")
+    # so a fold's parameters can go straight back into fader.superfade
+    for col in grid.columns:
+        folds[col] = pd.Series([row[col] for row in rows], dtype=object)
+    stats = win_loss_report.win_loss_table(folds.wins.to_numpy(), folds.losses.to_numpy(), vig=vig, adjust=None)
+    folds = pd.concat([folds.drop(columns=['wins', 'losses']), stats[['wins', 'losses', 'units', 'win_pct']]], axis=1)
+
+    overall = pd.Series(win_loss_report.win_loss_stats(int(folds.wins.sum()), int(folds.losses.sum()), vig=vig))
+    return (folds, overall)
+
+def report(folds, overall, vig=1.1):
+    # print the folds, then win_loss_report on everything out of sample
+    print(folds.to_string())
+    print()
+    win_loss_report.win_loss_report(int(overall.wins), int(overall.losses), vig=vig)
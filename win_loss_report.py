@@ -1,4 +1,6 @@
 from scipy.stats import norm
+from scipy.stats import binom
+from scipy.stats import false_discovery_control
 from scipy.stats import chisquare
 import numpy as np
 import pandas as pd
@@ -9,11 +11,24 @@ def win_loss_from_df(df):
     print("\n")
     print(ct)
 
-def win_loss_report(wins, losses, vig=1.1):
-    win_pct = wins / (wins+losses)
-    expected_wins = (wins + losses) /2
-    std = np.sqrt(wins + losses)/2
-    z_score = (wins-expected_wins) / std
+def win_loss_table(wins, losses, vig=1.1, index=None, adjust='bh'):
+    """
+    win_loss_report for a whole batch of records at once. wins and losses are
+    arrays (one entry per strategy), and you get back one row per strategy.
+
+    p_value is the one-sided z test like win_loss_report. binom_p is the exact
+    one-sided binomial test (chance of at least this many wins flipping coins).
+    adjusted_p corrects binom_p for testing all the rows at once:
+    'bh' (Benjamini-Hochberg), 'bonferroni', or None to skip it.
+    """
+    wins = np.asarray(wins)
+    losses = np.asarray(losses)
+    games = wins + losses
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_pct = wins / games
+        expected_wins = games / 2
+        std = np.sqrt(games)/2
+        z_score = (wins-expected_wins) / std
     p_value = norm.cdf(z_score)
     profit_pct = 100 * (win_pct - (vig * (1-win_pct)))
 
@@ -41,16 +56,82 @@ def win_loss_report(wins, losses, vig=1.1):
 
     betting_market = (.97*wins) - (1.017 * losses)
 
+    # sf(k-1) is P(X >= k)
+    binom_p = binom.sf(wins - 1, games, .5)
+    binom_p[games == 0] = np.nan
+
+    table = pd.DataFrame({'wins': wins,
+                          'losses': losses,
+                          'units': wins - (vig*losses),
+                          'units_110': wins - (1.1*losses),
+                          'units_106': wins - (1.06 * losses),
+                          'units_105': wins - (1.05 * losses),
+                          'betting_market': betting_market,
+                          'win_pct': win_pct,
+                          'expected_wins': expected_wins,
+                          'excess': wins - expected_wins,
+                          'profit_pct': profit_pct,
+                          'z_score': z_score,
+                          'std': std,
+                          'p_value': 1-p_value,
+                          'binom_p': binom_p}, index=index)
+    if adjust is not None:
+        table['adjusted_p'] = adjust_p_values(binom_p, method=adjust)
+    return table
+
+def adjust_p_values(p_values, method='bh'):
+    """
+    Multiple comparison correction. 'bh' is Benjamini-Hochberg (controls the false
+    discovery rate), 'bonferroni' is p * number of tests. NaNs are left out.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full(len(p_values), np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    m = len(tested)
+    if m == 0:
+        return adjusted
+
+    if method == 'bonferroni':
+        adjusted[tested] = np.minimum(1, p_values[tested] * m)
+    elif method == 'bh':
+        adjusted[tested] = false_discovery_control(p_values[tested], method='bh')
+    else:
+        raise ValueError(f"unknown adjustment {method}")
+    return adjusted
+
+def win_loss_by(df, by, vig=1.1, adjust='bh'):
+    """
+    win_loss_table for every group of picks in df (eg a column naming the strategy),
+    counted the way win_loss_from_df does: pushes don't count either way.
+    """
+    graded = df[df.winner_ats.notna() & df.fade.notna()]
+    won = (graded.fade.astype(object) == graded.winner_ats.astype(object))
+    counts = won.groupby([graded[col] for col in ([by] if isinstance(by, str) else by)], observed=True).agg(['sum', 'count'])
+    return win_loss_table(counts['sum'].to_numpy(), (counts['count'] - counts['sum']).to_numpy(),
+                          vig=vig, index=counts.index, adjust=adjust)
+
+def win_loss_stats(wins, losses, vig=1.1):
+    """
+    The numbers behind win_loss_report, as a dict instead of printed.
+    """
+    stats = win_loss_table([wins], [losses], vig=vig, adjust=None).iloc[0].to_dict()
+    stats['wins'] = wins
+    stats['losses'] = losses
+    return stats
+
+def win_loss_report(wins, losses, vig=1.1):
+    stats = win_loss_stats(wins, losses, vig=vig)
+
     print(f"record:   {wins} - {losses}")
     if vig != 1.1:
-        print(f"actual ({vig} vig) units: { round(wins - (vig*losses), 2)}")
+        print(f"actual ({vig} vig) units: { round(stats['units'], 2)}")
     
-    print(f"full vig (-110) units: { round(wins - (1.1*losses),2) }")
-    print(f"reduced juice (-106) : { round(wins - (1.06 * losses),2) }")
-    print(f"reduced juice (-105) : { round(wins - (1.05 * losses),2) }")
-    print(f"betting market       : { round(betting_market, 2) }")
-
-    print(f"win pct: {round(100 *win_pct,2)}%, expected wins: {expected_wins}")
-    print(f"excess: {wins - expected_wins}, profit %: {round(profit_pct,2)}")
-    print(f"z test: {round(z_score,2)}, std: {round(std,2)} , p-value: {round(1-p_value, 4)}")
+    print(f"full vig (-110) units: { round(stats['units_110'],2) }")
+    print(f"reduced juice (-106) : { round(stats['units_106'],2) }")
+    print(f"reduced juice (-105) : { round(stats['units_105'],2) }")
+    print(f"betting market       : { round(stats['betting_market'], 2) }")
+
+    print(f"win pct: {round(100 *stats['win_pct'],2)}%, expected wins: {stats['expected_wins']}")
+    print(f"excess: {stats['excess']}, profit %: {round(stats['profit_pct'],2)}")
+    print(f"z test: {round(stats['z_score'],2)}, std: {round(stats['std'],2)} , p-value: {round(stats['p_value'], 4)}")
 